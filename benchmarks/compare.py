@@ -0,0 +1,62 @@
+"""
+Compares a benchmark result with a baseline and exits with status 1 when a request got slower
+or a scenario lost throughput by more than the tolerance, or when a request started to fail.
+
+    python -m benchmarks.compare baseline.json results.json --tolerance 0.25
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline: dict, current: dict, tolerance: float, metric: str) -> list[str]:
+    """
+    The compare function returns the regressions of the current result against the baseline.
+
+    :param baseline: dict: The baseline result
+    :param current: dict: The current result
+    :param tolerance: float: The allowed relative regression, 0.25 is 25%
+    :param metric: str: The latency that is compared, e.g. p95_ms
+    :return: A list of descriptions of the regressions
+    """
+    regressions = []
+    for name, base in baseline["scenarios"].items():
+        scenario = current["scenarios"].get(name)
+        if scenario is None:
+            continue
+        if scenario["throughput_ops"] < base["throughput_ops"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_ops']} -> {scenario['throughput_ops']} ops/s")
+        for label, base_request in base["requests"].items():
+            request = scenario["requests"].get(label)
+            if request is None:
+                continue
+            if request[metric] > base_request[metric] * (1 + tolerance):
+                regressions.append(f"{label}: {metric} {base_request[metric]} -> {request[metric]}")
+            if request["errors"] > base_request["errors"]:
+                regressions.append(f"{label}: errors {base_request['errors']} -> {request['errors']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare a benchmark result with a baseline")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--metric", default="p95_ms", choices=("p50_ms", "p95_ms", "p99_ms", "mean_ms"))
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    regressions = compare(baseline, current, args.tolerance, args.metric)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Prepares the process for a benchmark run before the app is imported: the settings are pointed at the
+benchmark database and a temporary media directory, Redis is replaced with fakeredis and the files are
+stored by the local storage backend instead of Cloudinary, so a run needs no network.
+"""
+import os
+import tempfile
+
+
+def prepare(database_url: str | None, bcrypt_rounds: int) -> str:
+    """
+    The prepare function configures the environment of the app for a benchmark run.
+    It has to be called before anything from src or main is imported.
+
+    :param database_url: str | None: The database of the run, a temporary SQLite file when None
+    :param bcrypt_rounds: int: The bcrypt cost of the password hashes
+    :return: The database url
+    """
+    workdir = tempfile.mkdtemp(prefix="photoshare-bench-")
+    database_url = database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.sqlite3')}"
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URL": database_url,
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_PATH": os.path.join(workdir, "media"),
+        "BCRYPT_ROUNDS": str(bcrypt_rounds),
+        # the scenarios record the database time of every request from the Server-Timing header
+        "DB_SERVER_TIMING": "true",
+    })
+
+    import fakeredis
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+
+    class FakeRedis(fakeredis.aioredis.FakeRedis):
+        # every client of the app shares one fake server, like they share one Redis
+        def __init__(self, *args, **kwargs):
+            kwargs["server"] = server
+            super().__init__(*args, **kwargs)
+
+    redis.asyncio.Redis = FakeRedis
+    return database_url
@@ -0,0 +1,175 @@
+"""
+Microbenchmarks of single components of the app, measured in process without the HTTP stack.
+
+    python -m benchmarks.micro render --images 200 --workers 1 2 4
+    python -m benchmarks.micro auth --tokens 1000 --passes 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.run import git_revision
+
+logger = logging.getLogger("benchmarks")
+
+RENDER_STEPS = (
+    {"crop": "fill"},
+    {"crop": "fit", "angle": 90},
+    {"crop": "fill", "effect": "grayscale"},
+    {"crop": "scale", "effect": "sharpen"},
+)
+
+
+def make_source(path: Path, width: int, height: int):
+    from PIL import Image
+
+    # noise compresses and decodes about as badly as a photo, a flat color would be too cheap
+    bands = [Image.effect_noise((width, height), sigma) for sigma in (40, 60, 80)]
+    Image.merge("RGB", bands).save(path, format="JPEG", quality=90)
+
+
+async def bench_render(args) -> dict:
+    """
+    The bench_render function renders distinct derivatives of one source image with the image engine,
+    once cold and once from the derivative cache, for every number of worker processes.
+
+    :param args: The parsed arguments
+    :return: The results by number of workers
+    """
+    from src.services.image_engine import ImageEngine
+    from src.services.transformed_image import transformation_key
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="photoshare-render-") as workdir:
+        source = Path(workdir) / "source.jpg"
+        make_source(source, args.source_width, args.source_height)
+        for workers in args.workers:
+            engine = ImageEngine(os.path.join(workdir, f"derived-{workers}"), workers)
+            try:
+                # the pool starts its processes on demand, they are started before the clock runs
+                await asyncio.gather(*(engine.get(source, f"width={8 + i}") for i in range(workers)))
+                keys = [transformation_key([{"width": 200 + i, "height": 150 + i % 300,
+                                             **RENDER_STEPS[i % len(RENDER_STEPS)]}])
+                        for i in range(args.images)]
+
+                started = time.perf_counter()
+                await asyncio.gather(*(engine.get(source, key) for key in keys))
+                cold = time.perf_counter() - started
+
+                started = time.perf_counter()
+                await asyncio.gather(*(engine.get(source, key) for key in keys))
+                warm = time.perf_counter() - started
+            finally:
+                engine.shutdown()
+            # more workers than cores share the cores
+            cores = min(workers, os.cpu_count())
+            results[str(workers)] = {
+                "images": args.images,
+                "cores": cores,
+                "cold_s": round(cold, 3),
+                "images_per_s": round(args.images / cold, 2),
+                "images_per_s_per_core": round(args.images / cold / cores, 2),
+                "cached_images_per_s": round(args.images / warm, 2),
+            }
+            logger.info("render, %s workers: %s images/s, %s per core", workers,
+                        results[str(workers)]["images_per_s"], results[str(workers)]["images_per_s_per_core"])
+    return {"source": f"{args.source_width}x{args.source_height}", "workers": results}
+
+
+async def bench_auth(args) -> dict:
+    """
+    The bench_auth function decodes distinct access tokens with decode_access_token, once with an empty
+    token cache before every pass, so every call checks the signature, and once from the filled cache.
+
+    :param args: The parsed arguments
+    :return: The results of both runs and the speedup of the cache
+    """
+    from src.services.auth import auth_service
+    from src.services.local_cache import ExpiringLRUCache
+
+    tokens = [await auth_service.create_access_token({"sub": f"user{i}@example.com"}) for i in range(args.tokens)]
+    calls = args.tokens * args.passes
+    # the cache holds all tokens, the cached run has no misses
+    cache, size = auth_service.token_cache, max(args.tokens, auth_service.token_cache.maxsize)
+    try:
+        uncached = 0.0
+        for _ in range(args.passes):
+            auth_service.token_cache = ExpiringLRUCache(size)
+            started = time.perf_counter()
+            for token in tokens:
+                auth_service.decode_access_token(token)
+            uncached += time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(args.passes):
+            for token in tokens:
+                auth_service.decode_access_token(token)
+        cached = time.perf_counter() - started
+    finally:
+        auth_service.token_cache = cache
+
+    results = {"tokens": args.tokens, "calls": calls}
+    for name, duration in (("uncached", uncached), ("cached", cached)):
+        results[name] = {
+            "duration_s": round(duration, 3),
+            "decodes_per_s": round(calls / duration, 2),
+            "us_per_decode": round(duration / calls * 1e6, 3),
+        }
+    results["speedup"] = round(uncached / cached, 2)
+    logger.info("auth: %s decodes/s uncached, %s cached", results["uncached"]["decodes_per_s"],
+                results["cached"]["decodes_per_s"])
+    return results
+
+
+BENCHMARKS = {
+    "render": bench_render,
+    "auth": bench_auth,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PhotoShare microbenchmarks")
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    parser.add_argument("--images", type=int, default=100, help="render: derivatives per run")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count()}),
+                        help="render: worker processes of the runs")
+    parser.add_argument("--source-width", type=int, default=2400, help="render: size of the source image")
+    parser.add_argument("--source-height", type=int, default=1600)
+    parser.add_argument("--tokens", type=int, default=1000, help="auth: distinct access tokens")
+    parser.add_argument("--passes", type=int, default=20, help="auth: decodes of every token per run")
+    parser.add_argument("--output", help="result file, stdout by default")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "benchmark": args.benchmark,
+        },
+        "results": asyncio.run(BENCHMARKS[args.benchmark](args)),
+    }
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        sys.stdout.write(report + "\n")
+
+
+if __name__ == '__main__':
+    main()
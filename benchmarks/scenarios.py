@@ -0,0 +1,531 @@
+"""
+The benchmark scenarios. Every scenario is a coroutine that runs one operation of a user flow against
+the app through the API and records the latency of every request it makes.
+"""
+import asyncio
+import contextlib
+import io
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+from typing import AsyncContextManager, Awaitable, Callable, Dict, List, Set, Tuple
+
+import httpx
+from PIL import Image
+
+from benchmarks.stats import Recorder, parse_db_time, percentile
+
+PASSWORD = "secret1"
+WORDS = ("sea", "sunset", "mountain", "city", "forest", "river", "night", "portrait", "street", "winter",
+         "flowers", "bridge", "lake", "desert", "snow", "clouds", "beach", "market", "train", "garden")
+
+
+def make_jpeg(size: int = 64) -> bytes:
+    stream = io.BytesIO()
+    Image.new("RGB", (size, size), (200, 120, 40)).save(stream, format="JPEG")
+    return stream.getvalue()
+
+
+@dataclass
+class BenchUser:
+    id: int
+    email: str
+    headers: Dict[str, str]
+
+
+@dataclass
+class State:
+    """
+    The State keeps what the scenarios share: the seeded users and images and the unique counters.
+    """
+    admin: BenchUser = None
+    users: List[BenchUser] = field(default_factory=list)
+    images: List[Tuple[int, int]] = field(default_factory=list)  # (image id, owner id)
+    tags: List[str] = field(default_factory=list)  # names of the tags on the images
+    transformed: List[int] = field(default_factory=list)  # images with transformations
+    transformations: List[Tuple[int, str]] = field(default_factory=list)  # (transformation id, url)
+    storm_users: List[BenchUser] = field(default_factory=list)  # users with hashes of the default bcrypt cost
+    rated: Set[Tuple[int, int]] = field(default_factory=set)  # (user id, image id) with a rating
+    sequence: itertools.count = field(default_factory=lambda: itertools.count(1))
+    jpeg: bytes = field(default_factory=make_jpeg)
+
+    def unique(self) -> int:
+        return next(self.sequence)
+
+
+class Client:
+    """
+    The Client sends the requests of the scenarios and records them under a label.
+    A response with an unexpected status is counted as an error of the label.
+    Numbers of a scenario that are not request latencies go to the report of the client.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder):
+        self.http = http
+        self.recorder = recorder
+        self.report: Dict[str, object] = {}
+
+    async def request(self, label: str, method: str, url: str, expected: Tuple[int, ...] = (200,),
+                      **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.http.request(method, url, **kwargs)
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.recorder.record(label, latency_ms, parse_db_time(response.headers.get("server-timing")),
+                             response.status_code in expected)
+        return response
+
+
+async def register(client: Client, state: State, label: str = "auth") -> BenchUser:
+    from src.services.auth import auth_service
+
+    number = state.unique()
+    email = f"bench{number}@example.com"
+    response = await client.request(f"{label}.signup", "POST", "/api/auth/signup", expected=(201,),
+                                    json={"username": f"bench{number:07d}", "email": email, "password": PASSWORD})
+    user_id = response.json()["id"]
+    token = auth_service.create_email_token({"sub": email})
+    await client.request(f"{label}.confirm", "GET", f"/api/auth/confirmed_email/{token}")
+    response = await client.request(f"{label}.login", "POST", "/api/auth/login",
+                                    data={"username": email, "password": PASSWORD})
+    return BenchUser(user_id, email, {"Authorization": f"Bearer {response.json()['access_token']}"})
+
+
+async def upload(client: Client, state: State, user: BenchUser, label: str = "upload.add") -> int:
+    response = await client.request(label, "POST", "/api/images/add", expected=(201,), headers=user.headers,
+                                    params={"description": " ".join(random.sample(WORDS, 3))},
+                                    files={"file": (f"photo{state.unique()}.jpg", state.jpeg, "image/jpeg")})
+    image_id = response.json()["image"]["id"]
+    state.images.append((image_id, user.id))
+    return image_id
+
+
+async def seed(client: Client, state: State, users: int, images: int, comments: int):
+    """
+    The seed function creates the data the scenarios work on. The first user is the admin.
+
+    :param client: Client: The client, its requests are recorded by a separate recorder
+    :param state: State: The state to fill
+    :param users: int: The number of regular users
+    :param images: int: The number of images, spread over the users
+    :param comments: int: The number of comments, spread over the images
+    :return: Nothing
+    """
+    state.admin = await register(client, state, "seed")
+    state.tags = list(WORDS)
+    for _ in range(users):
+        state.users.append(await register(client, state, "seed"))
+    for number in range(images):
+        image_id = await upload(client, state, state.users[number % users], "seed.upload")
+        owner = state.users[number % users]
+        await client.request("seed.tags", "POST", f"/api/images/{image_id}/tags", headers=owner.headers,
+                             json={"tags": random.sample(WORDS, 3)})
+        response = await client.request("seed.transform", "POST", f"/api/transformed_images/{image_id}",
+                                        expected=(201,), json={"width": 300, "height": 300, "crop": "fill", "angle": 0})
+        state.transformed.append(image_id)
+        state.transformations.append((response.json()["id"], response.json()["transform_image_url"]))
+    for number in range(comments):
+        image_id, _ = state.images[number % len(state.images)]
+        user = random.choice(state.users)
+        await client.request("seed.comment", "POST", "/api/comments/", expected=(201,), headers=user.headers,
+                             json={"comment": " ".join(random.sample(WORDS, 4)), "image_id": image_id})
+
+
+async def load(client: Client, state: State, users: int, images: int = 1000):
+    """
+    The load function fills the state from a database that benchmarks.generate loaded, instead of seeding it:
+    it logs in the admin and the first users of the dataset and samples the images, tags and transformations.
+
+    :param client: Client: The client, its requests are recorded by a separate recorder
+    :param state: State: The state to fill
+    :param users: int: The number of regular users to log in
+    :param images: int: The number of images to sample
+    :return: Nothing
+    """
+    from sqlalchemy import func, select
+
+    from benchmarks.generate import PASSWORD as GENERATED_PASSWORD
+    from src.database.db import SessionLocal
+    from src.database.models import Image, Role, Tag, TransformedImage, User
+
+    async with SessionLocal() as db:
+        accounts = (await db.execute(
+            select(User.id, User.email, User.role).where(User.confirmed.is_(True), User.banned.is_(False),
+                                                         User.role.in_((Role.admin, Role.user)))
+            .order_by(User.role != Role.admin, User.id).limit(users + 1))).all()
+        state.images = [tuple(row) for row in
+                        await db.execute(select(Image.id, Image.user_id).order_by(func.random()).limit(images))]
+        state.tags = (await db.scalars(select(Tag.name).order_by(Tag.id))).all()
+        state.transformations = [tuple(row) for row in await db.execute(
+            select(TransformedImage.id, TransformedImage.transform_image_url).limit(images))]
+        state.transformed = (await db.scalars(select(TransformedImage.image_id).distinct().limit(images))).all()
+    if len(accounts) < 2 or accounts[0].role != Role.admin:
+        raise RuntimeError("The database has no admin or no users, load it with benchmarks.generate")
+
+    for user_id, email, _ in accounts:
+        response = await client.request("load.login", "POST", "/api/auth/login",
+                                        data={"username": email, "password": GENERATED_PASSWORD})
+        response.raise_for_status()
+        user = BenchUser(user_id, email, {"Authorization": f"Bearer {response.json()['access_token']}"})
+        if state.admin is None:
+            state.admin = user
+        else:
+            state.users.append(user)
+
+
+async def auth_flow(client: Client, state: State):
+    await register(client, state)
+
+
+async def upload_flow(client: Client, state: State):
+    await upload(client, state, random.choice(state.users))
+
+
+async def tags_flow(client: Client, state: State):
+    headers = state.admin.headers
+    response = await client.request("tags.create", "POST", "/api/tags/", headers=headers,
+                                    json={"name": f"tag{state.unique()}"})
+    tag_id = response.json()["id"]
+    await client.request("tags.list", "GET", "/api/tags/", headers=headers, params={"limit": 50})
+    await client.request("tags.read", "GET", f"/api/tags/{tag_id}", headers=headers)
+    await client.request("tags.update", "PUT", f"/api/tags/{tag_id}", headers=headers,
+                         json={"name": f"renamed{state.unique()}"})
+    await client.request("tags.delete", "DELETE", f"/api/tags/{tag_id}", headers=headers)
+
+
+async def comments_flow(client: Client, state: State):
+    user = random.choice(state.users)
+    image_id, _ = random.choice(state.images)
+    response = await client.request("comments.create", "POST", "/api/comments/", expected=(201,),
+                                    headers=user.headers, json={"comment": "nice shot", "image_id": image_id})
+    comment_id = response.json()["id"]
+    await client.request("comments.list", "GET", "/api/comments/", headers=user.headers,
+                         params={"image_id": image_id, "limit": 20})
+    await client.request("comments.update", "PUT", f"/api/comments/{comment_id}", headers=user.headers,
+                         json={"comment": "really nice shot", "user_id": user.id, "image_id": image_id})
+    await client.request("comments.delete", "DELETE", f"/api/comments/{comment_id}", headers=state.admin.headers)
+
+
+async def ratings_flow(client: Client, state: State):
+    for _ in range(100):
+        user = random.choice(state.users)
+        image_id, owner_id = random.choice(state.images)
+        if owner_id != user.id and (user.id, image_id) not in state.rated:
+            break
+    else:
+        return
+    state.rated.add((user.id, image_id))
+    try:
+        response = await client.request("ratings.create", "POST", f"/api/ratings/{image_id}",
+                                        headers=user.headers, json={"rating": random.randint(1, 5)})
+        rating_id = response.json()["id"]
+        await client.request("ratings.average", "GET", f"/api/ratings/image/{image_id}", headers=user.headers)
+        await client.request("ratings.update", "PUT", f"/api/ratings/{rating_id}", headers=user.headers,
+                             json={"rating": random.randint(1, 5)})
+        await client.request("ratings.delete", "DELETE", f"/api/ratings/{rating_id}", headers=state.admin.headers)
+    finally:
+        state.rated.discard((user.id, image_id))
+
+
+async def listings_flow(client: Client, state: State):
+    user = random.choice(state.users)
+    image_ids = [image_id for image_id, _ in random.sample(state.images, min(20, len(state.images)))]
+    await client.request("listings.tags", "GET", "/api/tags/", headers=user.headers)
+    await client.request("listings.comments", "GET", "/api/comments/", headers=user.headers,
+                         params={"image_id": image_ids[0]})
+    await client.request("listings.transformed", "GET", f"/api/transformed_images/{random.choice(state.transformed)}",
+                         headers=user.headers)
+    await client.request("listings.ratings", "GET", "/api/ratings/images/average", headers=user.headers,
+                         params={"image_ids": image_ids})
+    await client.request("listings.tag_search", "GET", "/api/images/search", headers=user.headers,
+                         params={"tags": random.sample(state.tags, 2), "mode": random.choice(("all", "any"))})
+    await client.request("listings.text_search", "GET", "/api/search/images", headers=user.headers,
+                         params={"q": random.choice(WORDS)})
+
+
+async def tag_search_flow(client: Client, state: State):
+    """
+    The tag_search_flow scenario searches images by one to three tags, with both modes, and pages on
+    with after_id while the pages are full. The tags are drawn from the most used ones, which match the
+    most images, and from all tags.
+    """
+    user = random.choice(state.users)
+    tags = random.sample(state.tags[:20] if random.random() < 0.5 else state.tags, random.randint(1, 3))
+    mode = random.choice(("all", "any"))
+    params = {"tags": tags, "mode": mode, "limit": 50}
+    for page in range(3):
+        response = await client.request(f"tag_search.{mode}", "GET", "/api/images/search", headers=user.headers,
+                                        params=params)
+        images = response.json()
+        if len(images) < params["limit"]:
+            break
+        params["after_id"] = images[-1]["id"]
+
+
+async def text_search_flow(client: Client, state: State):
+    """
+    The text_search_flow scenario searches image descriptions and comments for one or two words.
+    """
+    user = random.choice(state.users)
+    for target in ("images", "comments"):
+        await client.request(f"text_search.{target}", "GET", f"/api/search/{target}", headers=user.headers,
+                             params={"q": " ".join(random.sample(WORDS, random.randint(1, 2)))})
+
+
+RATINGS_BATCH_SIZE = 50
+
+
+async def ratings_batch_flow(client: Client, state: State):
+    """
+    The ratings_batch_flow scenario loads the average ratings of a gallery page twice: with one request
+    to the batch endpoint and with one request per image, one after another. The sequential calls are
+    recorded as one sample of their total time, the report has the ratio of the mean times.
+    """
+    user = random.choice(state.users)
+    image_ids = [image_id for image_id, _ in random.sample(state.images, min(RATINGS_BATCH_SIZE, len(state.images)))]
+    await client.request("ratings_batch.batch", "GET", "/api/ratings/images/average", headers=user.headers,
+                         params={"image_ids": image_ids})
+
+    started, ok = time.perf_counter(), True
+    for image_id in image_ids:
+        response = await client.http.get(f"/api/ratings/image/{image_id}", headers=user.headers)
+        ok = ok and response.status_code == 200
+    client.recorder.record("ratings_batch.sequential", (time.perf_counter() - started) * 1000, None, ok)
+
+    latencies = client.recorder.latencies
+    batch, sequential = latencies["ratings_batch.batch"], latencies["ratings_batch.sequential"]
+    client.report.update({"images": len(image_ids),
+                          "sequential_to_batch": round(sum(sequential) / len(sequential) / (sum(batch) / len(batch)), 2)})
+
+
+async def _mixed_comments(client: Client, state: State, user: BenchUser):
+    image_id, _ = random.choice(state.images)
+    await client.request("mixed.comments", "GET", "/api/comments/", headers=user.headers,
+                         params={"image_id": image_id, "limit": 20})
+
+
+async def _mixed_tags(client: Client, state: State, user: BenchUser):
+    await client.request("mixed.tags", "GET", "/api/tags/", headers=user.headers, params={"limit": 50})
+
+
+async def _mixed_ratings(client: Client, state: State, user: BenchUser):
+    image_ids = [image_id for image_id, _ in random.sample(state.images, min(20, len(state.images)))]
+    await client.request("mixed.ratings", "GET", "/api/ratings/images/average", headers=user.headers,
+                         params={"image_ids": image_ids})
+
+
+async def _mixed_search(client: Client, state: State, user: BenchUser):
+    await client.request("mixed.search", "GET", "/api/search/images", headers=user.headers,
+                         params={"q": random.choice(WORDS)})
+
+
+async def _mixed_tag_search(client: Client, state: State, user: BenchUser):
+    await client.request("mixed.tag_search", "GET", "/api/images/search", headers=user.headers,
+                         params={"tags": random.sample(state.tags, 2), "mode": "any"})
+
+
+async def _mixed_comment(client: Client, state: State, user: BenchUser):
+    image_id, _ = random.choice(state.images)
+    await client.request("mixed.comment", "POST", "/api/comments/", expected=(201,), headers=user.headers,
+                         json={"comment": " ".join(random.sample(WORDS, 4)), "image_id": image_id})
+
+
+async def _mixed_upload(client: Client, state: State, user: BenchUser):
+    await upload(client, state, user, "mixed.upload")
+
+
+async def pool_saturation_flow(client: Client, state: State):
+    """
+    The pool_saturation_flow scenario sends a burst of twice db_pool_size + db_max_overflow uncached
+    searches at once, so requests queue for a database connection. The pool status of /api/admin/db_pool
+    is sampled during the bursts and reported: checkouts, wait times, timeouts and the peak overflow.
+    Timeouts only show up with a short pool timeout, e.g. DB_POOL_SIZE=2 DB_POOL_TIMEOUT=0.05.
+    """
+    from src.conf.config import settings
+
+    report = client.report
+    burst = 2 * (settings.db_pool_size + settings.db_max_overflow)
+
+    async def pool_status() -> dict:
+        response = await client.http.get("/api/admin/db_pool", headers=state.admin.headers)
+        response.raise_for_status()
+        return response.json()
+
+    if not report:
+        report.update({"burst": burst, "pool_size": settings.db_pool_size, "max_overflow": settings.db_max_overflow,
+                       "pool_before": await pool_status(), "peak_checked_out": 0, "peak_overflow": 0})
+    done = asyncio.Event()
+
+    async def sample():
+        while not done.is_set():
+            try:
+                status = await pool_status()
+            except httpx.HTTPStatusError:
+                # the admin user may have to wait for a connection too
+                continue
+            report["peak_checked_out"] = max(report["peak_checked_out"], status["checked_out"])
+            report["peak_overflow"] = max(report["peak_overflow"], status["overflow"])
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample())
+    try:
+        await asyncio.gather(*[client.request("pool.search", "GET", "/api/search/images",
+                                              headers=random.choice(state.users).headers,
+                                              params={"q": " ".join(random.sample(WORDS, 2))})
+                               for _ in range(burst)])
+    finally:
+        done.set()
+        await sampler
+
+    before, after = report["pool_before"], await pool_status()
+    checkouts = after["checkouts"] - before["checkouts"]
+    wait_time = after["wait_time_total"] - before["wait_time_total"]
+    report.update({
+        "checkouts": checkouts,
+        "timeouts": after["timeouts"] - before["timeouts"],
+        "wait_time_total_ms": round(wait_time * 1000, 3),
+        "wait_time_avg_ms": round(wait_time / checkouts * 1000, 3) if checkouts else 0.0,
+        "wait_time_max_ms": round(after["wait_time_max"] * 1000, 3),
+    })
+
+
+LOGIN_STORM_USERS = 10
+LOGIN_STORM_BURST = 10
+
+
+async def _unrelated_request(client: Client, state: State, label: str):
+    user = random.choice(state.users)
+    if random.random() < 0.5:
+        await client.request(label, "GET", "/api/tags/", headers=user.headers, params={"limit": 50})
+    else:
+        image_id, _ = random.choice(state.images)
+        await client.request(label, "GET", "/api/comments/", headers=user.headers,
+                             params={"image_id": image_id, "limit": 20})
+
+
+@contextlib.asynccontextmanager
+async def login_storm_setup(client: Client, state: State):
+    """
+    The login_storm_setup function hashes the passwords with the default bcrypt cost of the settings for the
+    login_storm scenario, whatever --bcrypt-rounds is, and creates the users of the storm with it, so the
+    logins verify production hashes and are not rehashed. Before the storm the latency of the unrelated
+    requests is measured without logins; afterwards the logins per second and the p99 latency of the
+    unrelated requests with and without the storm go to the report.
+    """
+    from passlib.context import CryptContext
+
+    from src.conf.config import Settings
+    from src.services.auth import auth_service
+
+    rounds = Settings.__fields__["bcrypt_rounds"].default
+    auth_service.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    try:
+        state.storm_users = [await register(client, state, "login_storm.setup") for _ in range(LOGIN_STORM_USERS)]
+        for _ in range(100):
+            await _unrelated_request(client, state, "login_storm.unrelated_idle")
+        started = time.perf_counter()
+        yield
+        duration = time.perf_counter() - started
+    finally:
+        # the instance attribute shadows the context of the class
+        del auth_service.pwd_context
+
+    latencies = client.recorder.latencies
+    storm, idle = sorted(latencies["login_storm.unrelated"]), sorted(latencies["login_storm.unrelated_idle"])
+    client.report.update({
+        "bcrypt_rounds": rounds,
+        "logins_per_s": round(len(latencies["login_storm.login"]) / duration, 2),
+        "unrelated_p99_ms": round(percentile(storm, 99), 3),
+        "unrelated_idle_p99_ms": round(percentile(idle, 99), 3),
+    })
+
+
+async def login_storm_flow(client: Client, state: State):
+    """
+    The login_storm_flow scenario sends a burst of LOGIN_STORM_BURST logins at once and, until they are
+    answered, one unrelated read after another, to show how much the password hashing slows down the rest
+    of the app. It needs login_storm_setup.
+    """
+    logins = asyncio.gather(*[client.request("login_storm.login", "POST", "/api/auth/login",
+                                             data={"username": random.choice(state.storm_users).email,
+                                                   "password": PASSWORD})
+                              for _ in range(LOGIN_STORM_BURST)])
+    while not logins.done():
+        await _unrelated_request(client, state, "login_storm.unrelated")
+    await logins
+
+
+async def qrcode_cold_flow(client: Client, state: State):
+    """
+    The qrcode_cold_flow scenario requests the QR code of a transformation after dropping it from the
+    QR code cache, so every request renders it.
+    """
+    from src.services.transformed_image import qrcode_cache
+
+    transformed_id, url = random.choice(state.transformations)
+    qrcode_cache.pop(qrcode_cache.key(url, "png", 10, 4))
+    await client.request("qrcode.cold", "GET", f"/api/transformed_images/transformed/{transformed_id}/qrcode")
+
+
+@contextlib.asynccontextmanager
+async def qrcode_warm_setup(client: Client, state: State):
+    """
+    The qrcode_warm_setup function renders the QR codes of all transformations before the qrcode_warm scenario.
+    """
+    for transformed_id, _ in state.transformations:
+        await client.request("qrcode.setup", "GET", f"/api/transformed_images/transformed/{transformed_id}/qrcode")
+    yield
+
+
+async def qrcode_warm_flow(client: Client, state: State):
+    """
+    The qrcode_warm_flow scenario requests the QR code of a transformation from the warm QR code cache.
+    """
+    transformed_id, _ = random.choice(state.transformations)
+    await client.request("qrcode.warm", "GET", f"/api/transformed_images/transformed/{transformed_id}/qrcode")
+
+
+# (request, weight): mostly reads, with the writes of an active gallery
+MIXED_LOAD = (
+    (_mixed_comments, 35),
+    (_mixed_tags, 15),
+    (_mixed_ratings, 15),
+    (_mixed_search, 10),
+    (_mixed_tag_search, 10),
+    (_mixed_comment, 12),
+    (_mixed_upload, 3),
+)
+
+
+async def mixed_flow(client: Client, state: State):
+    """
+    The mixed_flow scenario sends one request drawn from MIXED_LOAD, so the throughput of the scenario
+    is the number of requests per second the app serves under a mixed read and write load.
+    """
+    requests, weights = zip(*MIXED_LOAD)
+    request = random.choices(requests, weights)[0]
+    await request(client, state, random.choice(state.users))
+
+
+SCENARIOS: Dict[str, Callable[[Client, State], Awaitable[None]]] = {
+    "auth": auth_flow,
+    "upload": upload_flow,
+    "tags": tags_flow,
+    "comments": comments_flow,
+    "ratings": ratings_flow,
+    "listings": listings_flow,
+    "mixed": mixed_flow,
+    "pool_saturation": pool_saturation_flow,
+    "ratings_batch": ratings_batch_flow,
+    "login_storm": login_storm_flow,
+    "qrcode_cold": qrcode_cold_flow,
+    "qrcode_warm": qrcode_warm_flow,
+    "tag_search": tag_search_flow,
+    "text_search": text_search_flow,
+}
+
+# a setup runs around all operations of its scenario
+SETUPS: Dict[str, Callable[[Client, State], AsyncContextManager[None]]] = {
+    "login_storm": login_storm_setup,
+    "qrcode_warm": qrcode_warm_setup,
+}
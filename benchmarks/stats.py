@@ -0,0 +1,66 @@
+import math
+from collections import defaultdict
+from typing import Dict, List
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """
+    The percentile function returns the nearest-rank percentile of the samples.
+
+    :param samples: List[float]: The samples, sorted
+    :param q: float: The percentile, 0..100
+    :return: The value of the percentile
+    """
+    if not samples:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(samples)), 1)
+    return samples[rank - 1]
+
+
+class Recorder:
+    """
+    The Recorder collects the latency of every request by label, e.g. "comments.create",
+    together with the time spent in the database as reported by the Server-Timing header.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.db_times: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, label: str, latency_ms: float, db_ms: float | None, ok: bool):
+        self.latencies[label].append(latency_ms)
+        if db_ms is not None:
+            self.db_times[label].append(db_ms)
+        if not ok:
+            self.errors[label] += 1
+
+    def summary(self, duration: float) -> dict:
+        requests = {}
+        for label in sorted(self.latencies):
+            samples = sorted(self.latencies[label])
+            db_times = self.db_times[label]
+            requests[label] = {
+                "count": len(samples),
+                "errors": self.errors[label],
+                "throughput_rps": round(len(samples) / duration, 2) if duration else 0.0,
+                "mean_ms": round(sum(samples) / len(samples), 3),
+                "p50_ms": round(percentile(samples, 50), 3),
+                "p95_ms": round(percentile(samples, 95), 3),
+                "p99_ms": round(percentile(samples, 99), 3),
+                "max_ms": round(samples[-1], 3),
+                "db_mean_ms": round(sum(db_times) / len(db_times), 3) if db_times else None,
+            }
+        return requests
+
+
+def parse_db_time(server_timing: str | None) -> float | None:
+    if not server_timing:
+        return None
+    for metric in server_timing.split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        if name == "db":
+            for param in params:
+                if param.startswith("dur="):
+                    return float(param[4:])
+    return None
@@ -1,23 +1,66 @@
-import redis.asyncio as redis
+import asyncio
+import contextlib
+import logging
+
 import uvicorn
 from fastapi import FastAPI
-from fastapi_limiter import FastAPILimiter
 
 from src.conf.config import settings
-from src.routes import transformed_images, auth, tags, comments_routes, images, ratings
+from src.database.db import SessionLocal
+from src.repository import tags as repository_tags
+from src.services.auth import password_executor
+from src.services import metrics
+from src.services.image_engine import image_engine
+from src.services.rate_limiter import rate_limiter
+from src.services.request_instrumentation import RequestInstrumentation
+from src.services.storage import init_cloudinary, storage_executor
+from src.routes import transformed_images, auth, tags, comments_routes, images, ratings, admin, search
+from src.routes import metrics as metrics_routes
 
 app = FastAPI()
 
+app.add_middleware(RequestInstrumentation,
+                   query_budget=settings.db_query_budget,
+                   instrument_queries=settings.db_instrumentation,
+                   server_timing=settings.db_server_timing,
+                   slow_query_ms=settings.db_slow_query_ms,
+                   metrics_enabled=settings.metrics_enabled)
+
+if settings.metrics_enabled:
+    app.include_router(metrics_routes.router)
+
 
 @app.get("/")
 def root():
     return {"message": "Welcome to FastAPI!"}
 
 
+async def refresh_tag_index():
+    while True:
+        try:
+            async with SessionLocal() as db:
+                await repository_tags.load_tag_index(db)
+        except Exception as err:  # noqa
+            logging.error("Could not refresh the tag index: %s", err)
+        await asyncio.sleep(settings.tag_index_refresh_interval)
+
+
 @app.on_event("startup")
 async def startup():
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
-    await FastAPILimiter.init(r)
+    init_cloudinary()
+    app.state.tag_index_task = asyncio.create_task(refresh_tag_index())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.tag_index_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await app.state.tag_index_task
+    await rate_limiter.close()
+    storage_executor.shutdown(wait=True)
+    password_executor.shutdown(wait=True)
+    image_engine.shutdown()
+    metrics.mark_process_dead()
 
 
 app.include_router(comments_routes.router, prefix='/api')
@@ -26,6 +69,8 @@ app.include_router(auth.router, prefix='/api')
 app.include_router(tags.router, prefix='/api')
 app.include_router(images.router, prefix='/api')
 app.include_router(ratings.router, prefix='/api')
+app.include_router(admin.router, prefix='/api')
+app.include_router(search.router, prefix='/api')
 
 
 
@@ -0,0 +1,94 @@
+"""Rating stars and image rating stats
+
+Revision ID: 3b9f5c1d2a7e
+Revises: 79e33bb6eaf2
+Create Date: 2026-10-18 10:12:41.518204
+
+"""
+import pickle
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9f5c1d2a7e'
+down_revision = '79e33bb6eaf2'
+branch_labels = None
+depends_on = None
+
+STARS = {"one_star": 1, "two_stars": 2, "three_stars": 3, "four_stars": 4, "four_srats": 4, "five_stars": 5}
+STAR_KEYS = {1: "one_star", 2: "two_stars", 3: "three_stars", 4: "four_stars", 5: "five_stars"}
+
+
+def upgrade() -> None:
+    op.add_column('ratings', sa.Column('stars', sa.SmallInteger(), nullable=True))
+
+    # convert the pickled {"one_star": bool, ...} dicts into the highest selected star
+    conn = op.get_bind()
+    ratings = sa.table('ratings', sa.column('id', sa.Integer), sa.column('rating', sa.LargeBinary),
+                       sa.column('stars', sa.SmallInteger))
+    for row in conn.execute(sa.select(ratings.c.id, ratings.c.rating)).all():
+        value = pickle.loads(row.rating) if row.rating else {}
+        selected = [STARS[key] for key, flag in value.items() if flag and key in STARS]
+        if selected:
+            conn.execute(ratings.update().where(ratings.c.id == row.id).values(stars=max(selected)))
+    conn.execute(ratings.delete().where(ratings.c.stars.is_(None)))
+
+    with op.batch_alter_table('ratings') as batch_op:
+        batch_op.drop_column('rating')
+        batch_op.alter_column('stars', new_column_name='rating', existing_type=sa.SmallInteger(), nullable=False)
+        batch_op.create_check_constraint('ck_ratings_rating', 'rating BETWEEN 1 AND 5')
+
+    # a user rates an image once, the unique index needs the repeated ratings to be removed first
+    op.execute(sa.text(
+        "DELETE FROM ratings WHERE user_id IS NOT NULL AND image_id IS NOT NULL AND id NOT IN "
+        "(SELECT MIN(id) FROM ratings GROUP BY user_id, image_id)"
+    ))
+    op.create_index('ix_ratings_user_id_image_id', 'ratings', ['user_id', 'image_id'], unique=True)
+
+    op.create_table('image_rating_stats',
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Integer(), nullable=False),
+    sa.Column('rating_count', sa.Integer(), nullable=False),
+    sa.Column('one_star', sa.Integer(), nullable=False),
+    sa.Column('two_stars', sa.Integer(), nullable=False),
+    sa.Column('three_stars', sa.Integer(), nullable=False),
+    sa.Column('four_stars', sa.Integer(), nullable=False),
+    sa.Column('five_stars', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['image_id'], ['images.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('image_id')
+    )
+    op.execute("""
+        INSERT INTO image_rating_stats
+            (image_id, rating_sum, rating_count, one_star, two_stars, three_stars, four_stars, five_stars)
+        SELECT image_id, SUM(rating), COUNT(*),
+               SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 3 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 4 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN rating = 5 THEN 1 ELSE 0 END)
+        FROM ratings
+        WHERE image_id IS NOT NULL
+        GROUP BY image_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('image_rating_stats')
+    op.drop_index('ix_ratings_user_id_image_id', table_name='ratings')
+
+    with op.batch_alter_table('ratings') as batch_op:
+        batch_op.drop_constraint('ck_ratings_rating', type_='check')
+        batch_op.alter_column('rating', new_column_name='stars', existing_type=sa.SmallInteger(), nullable=True)
+    op.add_column('ratings', sa.Column('rating', sa.PickleType(), nullable=True))
+
+    conn = op.get_bind()
+    ratings = sa.table('ratings', sa.column('id', sa.Integer), sa.column('rating', sa.LargeBinary),
+                       sa.column('stars', sa.SmallInteger))
+    for row in conn.execute(sa.select(ratings.c.id, ratings.c.stars)).all():
+        value = {key: number == row.stars for number, key in STAR_KEYS.items()}
+        conn.execute(ratings.update().where(ratings.c.id == row.id).values(rating=pickle.dumps(value)))
+
+    with op.batch_alter_table('ratings') as batch_op:
+        batch_op.drop_column('stars')
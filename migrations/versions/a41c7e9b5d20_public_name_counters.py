@@ -0,0 +1,42 @@
+"""Public name counters
+
+Revision ID: a41c7e9b5d20
+Revises: 8d2e4a6f0c13
+Create Date: 2026-10-18 11:47:05.921736
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41c7e9b5d20'
+down_revision = '8d2e4a6f0c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    counters_table = op.create_table('public_name_counters',
+    sa.Column('base_name', sa.String(), nullable=False),
+    sa.Column('counter', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('base_name')
+    )
+
+    # seed the counters from the existing names, "cat_3" moves the counter of "cat" to at least 3
+    conn = op.get_bind()
+    counters = {}
+    for (public_name,) in conn.execute(sa.text("SELECT public_name FROM images WHERE public_name IS NOT NULL")):
+        counters[public_name] = max(counters.get(public_name, 0), 1)
+        match = re.fullmatch(r"(.+)_(\d+)", public_name)
+        if match:
+            base_name, suffix = match.group(1), int(match.group(2))
+            counters[base_name] = max(counters.get(base_name, 0), suffix)
+    if counters:
+        op.bulk_insert(counters_table, [{"base_name": name, "counter": counter} for name, counter in counters.items()])
+
+
+def downgrade() -> None:
+    op.drop_table('public_name_counters')
@@ -0,0 +1,60 @@
+"""Transformation key
+
+Revision ID: c5e8f2a9b317
+Revises: a41c7e9b5d20
+Create Date: 2026-10-18 12:58:33.140287
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e8f2a9b317'
+down_revision = 'a41c7e9b5d20'
+branch_labels = None
+depends_on = None
+
+CLOUDINARY_PARAMS = {"a": "angle", "c": "crop", "h": "height", "w": "width"}
+
+
+def legacy_key(url: str) -> str | None:
+    # the transformation steps of the Cloudinary urls: .../image/upload/w_500/h_500/c_fill/a_15/<public id>
+    _, found, path = (url or "").partition("/upload/")
+    if not found:
+        return None
+    params = {}
+    for segment in path.split("/")[:-1]:
+        for part in segment.split(","):
+            short_name, _, value = part.partition("_")
+            if short_name not in CLOUDINARY_PARAMS or not value:
+                return None
+            name = CLOUDINARY_PARAMS[short_name]
+            params[name] = int(value) % 360 if name == "angle" else value.lower()
+    return ",".join(f"{name}={params[name]}" for name in sorted(params))
+
+
+def upgrade() -> None:
+    op.add_column('transformed_images', sa.Column('transformation_key', sa.String(length=255), nullable=True))
+
+    conn = op.get_bind()
+    transformed = sa.table('transformed_images', sa.column('id', sa.Integer), sa.column('image_id', sa.Integer),
+                           sa.column('transform_image_url', sa.String), sa.column('transformation_key', sa.String))
+    seen = set()
+    for row in conn.execute(sa.select(transformed.c.id, transformed.c.image_id, transformed.c.transform_image_url)):
+        key = legacy_key(row.transform_image_url)
+        if key is None or (row.image_id, key) in seen:
+            key = f"legacy:{row.id}"
+        seen.add((row.image_id, key))
+        conn.execute(transformed.update().where(transformed.c.id == row.id).values(transformation_key=key))
+
+    with op.batch_alter_table('transformed_images') as batch_op:
+        batch_op.alter_column('transformation_key', existing_type=sa.String(length=255), nullable=False)
+    op.create_index('ix_transformed_images_image_id_key', 'transformed_images', ['image_id', 'transformation_key'],
+                    unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transformed_images_image_id_key', table_name='transformed_images')
+    with op.batch_alter_table('transformed_images') as batch_op:
+        batch_op.drop_column('transformation_key')
@@ -0,0 +1,31 @@
+"""Image tag indexes
+
+Revision ID: e7b3d9a4c682
+Revises: c5e8f2a9b317
+Create Date: 2026-10-18 15:40:52.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3d9a4c682'
+down_revision = 'c5e8f2a9b317'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the unique index needs the duplicated links to be removed first
+    op.execute(sa.text(
+        "DELETE FROM image_m2m_tag WHERE id NOT IN "
+        "(SELECT MIN(id) FROM image_m2m_tag GROUP BY image_id, tag_id)"
+    ))
+    op.create_index('ix_image_m2m_tag_image_id_tag_id', 'image_m2m_tag', ['image_id', 'tag_id'], unique=True)
+    op.create_index('ix_image_m2m_tag_tag_id_image_id', 'image_m2m_tag', ['tag_id', 'image_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_image_m2m_tag_tag_id_image_id', table_name='image_m2m_tag')
+    op.drop_index('ix_image_m2m_tag_image_id_tag_id', table_name='image_m2m_tag')
@@ -0,0 +1,50 @@
+"""Full-text search over image descriptions and comments
+
+Revision ID: f2a6c8e1b945
+Revises: e7b3d9a4c682
+Create Date: 2026-10-18 16:25:09.530217
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6c8e1b945'
+down_revision = 'e7b3d9a4c682'
+branch_labels = None
+depends_on = None
+
+SEARCHABLE_COLUMNS = {'images': 'description', 'comments': 'comment'}
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table, column in SEARCHABLE_COLUMNS.items():
+        if dialect == 'sqlite':
+            fts = f'{table}_fts'
+            op.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({column}, content='{table}', content_rowid='id')")
+            op.execute(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                       f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END")
+            op.execute(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                       f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END")
+            op.execute(f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+                       f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+                       f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END")
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        else:
+            # the generated column is filled for the existing rows by the ALTER TABLE itself
+            op.execute(f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+                       f"(to_tsvector('simple', coalesce({column}, ''))) STORED")
+            op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table in SEARCHABLE_COLUMNS:
+        if dialect == 'sqlite':
+            for trigger in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+            op.execute(f'DROP TABLE IF EXISTS {table}_fts')
+        else:
+            op.drop_index(f'ix_{table}_search_vector', table_name=table)
+            op.drop_column(table, 'search_vector')
@@ -14,3 +14,7 @@ class AuthMessages:
 
 class RolesMessages:
     operation_forbidden = "Operation forbidden"
+
+
+class RateLimitMessages:
+    too_many_requests = "Too Many Requests"
@@ -1,23 +1,49 @@
 from fastapi import HTTPException
-from sqlalchemy import create_engine
-
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import DatabaseError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from src.conf.config import settings
+from src.database.pool import InstrumentedPool
+from src.database.query_stats import install_query_counter
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True, max_overflow=5)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    echo=settings.db_echo,
+    poolclass=InstrumentedPool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+if settings.db_instrumentation or settings.db_server_timing or settings.db_query_budget:
+    install_query_counter(engine)
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    except HTTPException:  # noqa
-        db.rollback()
-    finally:
-        db.close()
+async def get_db():
+    async with SessionLocal() as db:
+        try:
+            yield db
+        except HTTPException:  # noqa
+            await db.rollback()
+
+
+def get_pool_status() -> dict:
+    return engine.pool.status_dict()
+
+
+def get_insert(db: AsyncSession):
+    """
+    The get_insert function returns the dialect specific insert construct for the session's engine,
+    so repositories can use INSERT ... ON CONFLICT on both PostgreSQL and SQLite.
+
+    :param db: AsyncSession: The database session
+    :return: The insert function of the dialect
+    """
+    if db.bind.dialect.name == "sqlite":
+        return sqlite.insert
+    return postgresql.insert
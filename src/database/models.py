@@ -1,6 +1,7 @@
 import enum
 
-from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Boolean, Enum, PickleType
+from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Boolean, Enum, SmallInteger, \
+    CheckConstraint, Index
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql.schema import Table
 
@@ -10,6 +11,7 @@ Base = declarative_base()
 class Comment(Base):
 
     __tablename__ = 'comments'
+    __table_args__ = (Index('ix_comments_image_id_id', 'image_id', 'id'),)
 
     id = Column(Integer, primary_key=True, index=True)
     comment = Column(String(255))
@@ -35,12 +37,21 @@ class Image(Base):
     updated_at = Column('updated_at', DateTime, default=func.now(), onupdate=func.now())
 
 
+class PublicNameCounter(Base):
+    __tablename__ = "public_name_counters"
+
+    base_name = Column(String(), primary_key=True)
+    counter = Column(Integer, nullable=False, default=0)
+
+
 image_m2m_tag = Table(
     "image_m2m_tag",
     Base.metadata,
     Column("id", Integer, primary_key=True),
     Column("image_id", Integer, ForeignKey("images.id", ondelete="CASCADE")),
     Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE")),
+    Index("ix_image_m2m_tag_image_id_tag_id", "image_id", "tag_id", unique=True),
+    Index("ix_image_m2m_tag_tag_id_image_id", "tag_id", "image_id"),
 )
 
 
@@ -52,8 +63,11 @@ class Tag(Base):
 
 class TransformedImage(Base):
     __tablename__ = 'transformed_images'
+    __table_args__ = (Index('ix_transformed_images_image_id_id', 'image_id', 'id'),
+                      Index('ix_transformed_images_image_id_key', 'image_id', 'transformation_key', unique=True))
     id = Column(Integer, primary_key=True)
     transform_image_url = Column(String(), nullable=False)
+    transformation_key = Column(String(255), nullable=False)
     image_id = Column(Integer, ForeignKey('images.id', ondelete='CASCADE'), default=None)
     image = relationship('Image', backref='transformed_images')
 
@@ -80,10 +94,26 @@ class User(Base):
 class Rating(Base):
 
     __tablename__ = 'ratings'
+    __table_args__ = (CheckConstraint('rating BETWEEN 1 AND 5', name='ck_ratings_rating'),
+                      Index('ix_ratings_user_id_image_id', 'user_id', 'image_id', unique=True))
 
     id = Column(Integer, primary_key=True, index=True)
-    rating = Column(PickleType)
+    rating = Column(SmallInteger, nullable=False)
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="ratings")
     image_id = Column('image_id', ForeignKey('images.id', ondelete='CASCADE'), default=None)
     image = relationship('Image', backref="ratings")
+
+
+class ImageRatingStats(Base):
+
+    __tablename__ = 'image_rating_stats'
+
+    image_id = Column(Integer, ForeignKey('images.id', ondelete='CASCADE'), primary_key=True)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    one_star = Column(Integer, nullable=False, default=0)
+    two_stars = Column(Integer, nullable=False, default=0)
+    three_stars = Column(Integer, nullable=False, default=0)
+    four_stars = Column(Integer, nullable=False, default=0)
+    five_stars = Column(Integer, nullable=False, default=0)
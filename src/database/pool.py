@@ -0,0 +1,72 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.services import metrics
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_wait(self, elapsed: float):
+        self.checkouts += 1
+        self.wait_time_total += elapsed
+        if elapsed > self.wait_time_max:
+            self.wait_time_max = elapsed
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    The InstrumentedPool is a queue pool that also measures how long every checkout
+    waited for a connection and how many checkouts gave up with a pool timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            metrics.DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.record_wait(elapsed)
+            metrics.DB_POOL_WAIT.observe(elapsed)
+            self._update_gauges()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.DB_POOL_CHECKED_OUT.set(self.checkedout())
+        metrics.DB_POOL_OVERFLOW.set(max(self.overflow(), 0))
+
+    def status_dict(self) -> dict:
+        """
+        The status_dict function returns a snapshot of the pool state and the collected wait statistics.
+
+        :return: A dictionary with the pool counters
+        """
+        stats = self.stats
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "checkouts": stats.checkouts,
+            "timeouts": stats.timeouts,
+            "wait_time_total": stats.wait_time_total,
+            "wait_time_max": stats.wait_time_max,
+            "wait_time_avg": stats.wait_time_total / stats.checkouts if stats.checkouts else 0.0,
+        }
@@ -0,0 +1,95 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """
+    The QueryCounter collects the SQL statements of a block of code: their number, the total time spent
+    in the database and the duration of the slowest statement. Statements that took at least slow_threshold seconds are
+    kept for the slow-query log, all statements only when record_statements is set.
+    """
+
+    def __init__(self, parent: "QueryCounter | None" = None, record_statements: bool = False,
+                 slow_threshold: float | None = None):
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slow_threshold = slow_threshold
+        self.slow_statements: List[Tuple[str, float]] = []
+        self.statements: List[str] | None = [] if record_statements else None
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        if duration >= self.slowest_duration:
+            self.slowest_duration = duration
+        if self.slow_threshold is not None and duration >= self.slow_threshold:
+            self.slow_statements.append((statement, duration))
+        if self.statements is not None:
+            self.statements.append(statement)
+
+    def check_budget(self, max_queries: int):
+        """
+        The check_budget function raises QueryBudgetExceeded when more than max_queries SQL statements
+        were executed. A listing that loads a relationship per row (N+1) goes over any fixed budget as soon
+        as the page is big enough.
+
+        :param max_queries: int: The maximal number of statements
+        :return: Nothing
+        """
+        if self.count > max_queries:
+            statements = "\n".join(self.statements) if self.statements is not None else ""
+            raise QueryBudgetExceeded(f"{self.count} queries executed, the budget is {max_queries}:\n{statements}")
+
+
+_counter: ContextVar[QueryCounter | None] = ContextVar("query_counter", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _counter.get() is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _counter.get()
+    started = getattr(context, "_query_started", None)
+    if counter is None or started is None:
+        return
+    duration = time.perf_counter() - started
+    # nested counters count the statements of the enclosing ones too
+    while counter is not None:
+        counter.record(statement, duration)
+        counter = counter.parent
+
+
+def install_query_counter(engine: AsyncEngine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def count_queries(record_statements: bool = False, slow_threshold: float | None = None) -> Iterator[QueryCounter]:
+    """
+    The count_queries function counts and times the SQL statements executed in the block by the current task
+    and the tasks it starts.
+
+    :param record_statements: bool: Keep the text of every statement
+    :param slow_threshold: float | None: Keep the statements that took at least this many seconds
+    :return: The counter
+    """
+    counter = QueryCounter(_counter.get(), record_statements, slow_threshold)
+    token = _counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _counter.reset(token)
@@ -0,0 +1,56 @@
+from sqlalchemy import DDL, event
+
+from src.database.models import Image, Comment
+
+# the text search configuration of the PostgreSQL index, "simple" does no stemming,
+# so it fits descriptions in any language and matches the unicode61 tokenizer of SQLite
+SEARCH_CONFIG = "simple"
+
+SEARCHABLE_COLUMNS = {Image.__table__: "description", Comment.__table__: "comment"}
+
+
+def postgres_ddl(table: str, column: str) -> list[str]:
+    """
+    The postgres_ddl function returns the statements that add the full-text index of a table on PostgreSQL:
+    a generated tsvector column, kept up to date by the database on every write, and a GIN index over it.
+
+    :param table: str: The name of the table
+    :param column: str: The name of the text column
+    :return: A list of SQL statements
+    """
+    return [
+        f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+        f"(to_tsvector('{SEARCH_CONFIG}', coalesce({column}, ''))) STORED",
+        f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)",
+    ]
+
+
+def sqlite_ddl(table: str, column: str) -> list[str]:
+    """
+    The sqlite_ddl function returns the statements that add the full-text index of a table on SQLite:
+    an external content FTS5 table and the triggers that keep it in sync with the table.
+
+    :param table: str: The name of the table
+    :param column: str: The name of the text column
+    :return: A list of SQL statements
+    """
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column}, content='{table}', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+    ]
+
+
+# metadata.create_all (local runs) builds the same indexes as the migrations
+for _table, _column in SEARCHABLE_COLUMNS.items():
+    for _statement in postgres_ddl(_table.name, _column):
+        event.listen(_table, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+    for _statement in sqlite_ddl(_table.name, _column):
+        event.listen(_table, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+    event.listen(_table, "before_drop", DDL(f"DROP TABLE IF EXISTS {_table.name}_fts").execute_if(dialect="sqlite"))
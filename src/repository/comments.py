@@ -1,35 +1,49 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, raiseload
 
 from src.database.models import Comment
 from src.schemas.comment_schemas import CommentModel
+from src.services.response_cache import response_cache
 
 
-async def get_comments(db: Session):
-    return db.query(Comment).all()
+async def get_comments(after_id: int | None, limit: int, image_id: int | None, db: AsyncSession):
+    stmt = select(Comment).options(joinedload(Comment.user), raiseload("*"))
+    if image_id is not None:
+        stmt = stmt.filter(Comment.image_id == image_id)
+    if after_id is not None:
+        stmt = stmt.filter(Comment.id > after_id)
+    result = await db.execute(stmt.order_by(Comment.id).limit(limit))
+    return result.scalars().all()
 
 
-async def get_comment_by_id(comment_id: int, db: Session):
-    return db.query(Comment).filter_by(id=comment_id).first()
+async def get_comment_by_id(comment_id: int, db: AsyncSession):
+    result = await db.execute(select(Comment).options(joinedload(Comment.user), raiseload("*"))
+                              .filter_by(id=comment_id))
+    return result.scalars().first()
 
 
-async def create_comment(body: CommentModel, db: Session):
+async def create_comment(body: CommentModel, db: AsyncSession):
     comment = Comment(**body.dict())
     db.add(comment)
-    db.commit()
-    return comment
+    await db.commit()
+    await response_cache.invalidate("comments", f"comments:{comment.image_id}")
+    return await get_comment_by_id(comment.id, db)
 
 
-async def update_comment(body: CommentModel, comment_id, db: Session):
+async def update_comment(body: CommentModel, comment_id, db: AsyncSession):
     comment = await get_comment_by_id(comment_id, db)
     if comment:
         comment.comment = body.comment
-        db.commit()
+        await db.commit()
+        await response_cache.invalidate("comments", f"comments:{comment.image_id}")
     return comment
 
 
-async def remove_comment(comment_id, db: Session):
+async def remove_comment(comment_id, db: AsyncSession):
     comment = await get_comment_by_id(comment_id, db)
     if comment:
-        db.delete(comment)
-        db.commit()
+        await db.delete(comment)
+        await db.commit()
+        await response_cache.invalidate("comments", f"comments:{comment.image_id}")
     return comment
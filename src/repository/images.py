@@ -1,38 +1,146 @@
-from sqlalchemy.orm import Session
+from typing import List
 
-from src.database.models import Image, User
+from fastapi import HTTPException, status
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+
+from src.database.models import Image, User, Tag, image_m2m_tag
 from src.schemas.image_schemas import ImageUpdateModel
+from src.services.images import images_service_change_name
+from src.services.response_cache import response_cache
+from src.services.tag_postings import posting_lists, intersect, union
+
+MAX_NAME_ATTEMPTS = 10
+
+
+async def _reserve_image(db: AsyncSession, description: str, url: str | None, public_name: str, user: User) -> Image:
+    for _ in range(MAX_NAME_ATTEMPTS):
+        correct_public_name = await images_service_change_name(public_name, db)
+        db_image = Image(description=description, url=url, public_name=correct_public_name, user_id=user.id)
+        try:
+            async with db.begin_nested():
+                db.add(db_image)
+        except IntegrityError:
+            # the name is taken by an image that did not get it from the counter (e.g. "cat_2" uploaded as is),
+            # the counter has moved on, so the next attempt gets the next suffix
+            continue
+        return db_image
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Could not allocate a public name")
 
 
-async def add_image(db: Session, description: str, url: str, public_name: str, user: User):
+async def add_image(db: AsyncSession, description: str, url: str | None, public_name: str, user: User):
     if not user:
         return None
     # Save picture in the database
-    db_image = Image(description=description, url=url, public_name=public_name, user_id=user.id)
-    db.add(db_image)
-    db.commit()
-    db.refresh(db_image)
+    db_image = await _reserve_image(db, description, url, public_name, user)
+    await db.commit()
+    await db.refresh(db_image)
     return db_image
 
 
-async def get_images(db: Session, user: User):
-    return db.query(Image).filter(Image.user_id == user.id).all()
+async def add_images(db: AsyncSession, description: str, public_names: List[str], user: User):
+    db_images = [await _reserve_image(db, description, None, public_name, user) for public_name in public_names]
+    await db.commit()
+    for db_image in db_images:
+        await db.refresh(db_image)
+    return db_images
+
+
+async def update_image_urls(db: AsyncSession, db_images: List[Image], urls: List[str]):
+    for db_image, url in zip(db_images, urls):
+        db_image.url = url
+    await db.commit()
+    for db_image in db_images:
+        await db.refresh(db_image)
+    return db_images
+
+
+async def remove_images(db: AsyncSession, db_images: List[Image]):
+    for db_image in db_images:
+        await db.delete(db_image)
+    await db.commit()
 
 
-async def get_image(db: Session, id: int, user: User):
-    return db.query(Image).filter(Image.id == id and Image.user_id == user.id).first()
+async def get_images(db: AsyncSession, user: User):
+    result = await db.execute(select(Image).options(raiseload("*")).filter(Image.user_id == user.id))
+    return result.scalars().all()
 
 
-async def update_image(db: Session, image: ImageUpdateModel, user: User):
-    db_image = db.query(Image).filter(Image.id == image.id and Image.user_id == user.id).first()
+async def get_image(db: AsyncSession, id: int, user: User):
+    result = await db.execute(select(Image).filter(Image.id == id and Image.user_id == user.id))
+    return result.scalars().first()
+
+
+async def update_image(db: AsyncSession, image: ImageUpdateModel, user: User):
+    result = await db.execute(select(Image).filter(Image.id == image.id and Image.user_id == user.id))
+    db_image = result.scalars().first()
     db_image.description = image.description
-    db.commit()
-    db.refresh(db_image)
+    await db.commit()
+    await db.refresh(db_image)
     return db_image
 
 
-async def delete_image(db: Session, id: int, user: User):
-    db_image = db.query(Image).filter(Image.id == id and Image.user_id == user.id).first()
-    db.delete(db_image)
-    db.commit()
+async def delete_image(db: AsyncSession, id: int, user: User):
+    result = await db.execute(select(Image).filter(Image.id == id and Image.user_id == user.id))
+    db_image = result.scalars().first()
+    await db.delete(db_image)
+    await db.commit()
+    # the comments, ratings and transformations of the image are gone with it
+    await response_cache.invalidate("comments", f"comments:{db_image.id}", f"rating:{db_image.id}",
+                                    f"transformed:{db_image.id}")
     return db_image
+
+
+async def search_images_by_tags(tag_names: List[str], match_all: bool, after_id: int | None, limit: int,
+                                db: AsyncSession) -> List[Image]:
+    """
+    The search_images_by_tags function finds the images tagged with all (match_all) or any of the tags,
+    ordered by id and paged with the after_id cursor. The search runs on the cached posting lists
+    of the tags and falls back to a grouped query on image_m2m_tag for tags with too many images.
+    Images whose upload has not finished (without url) are left out.
+
+    :param tag_names: List[str]: The names of the tags
+    :param match_all: bool: True for images with every tag, False for images with any of them
+    :param after_id: int | None: Only images with a bigger id are returned
+    :param limit: int: The page size
+    :param db: AsyncSession: The database session
+    :return: A list of images
+    """
+    result = await db.execute(select(Tag.id).filter(Tag.name.in_(tag_names)))
+    tag_ids = result.scalars().all()
+    if not tag_ids or (match_all and len(tag_ids) < len(set(tag_names))):
+        return []
+    after_id = after_id if after_id is not None else 0
+
+    postings = [await posting_lists.get(tag_id, db) for tag_id in tag_ids]
+    if all(postings_list is not None for postings_list in postings):
+        images = []
+        # the posting lists hold the images whose upload has not finished yet too, they are skipped
+        while len(images) < limit:
+            wanted = limit - len(images)
+            image_ids = intersect(postings, after_id, wanted) if match_all else union(postings, after_id, wanted)
+            if not image_ids:
+                break
+            result = await db.execute(select(Image).options(raiseload("*"))
+                                      .filter(Image.id.in_(image_ids), Image.url.isnot(None)).order_by(Image.id))
+            images.extend(result.scalars().all())
+            if len(image_ids) < wanted:
+                break
+            after_id = image_ids[-1]
+        return images
+
+    stmt = select(image_m2m_tag.c.image_id) \
+        .join(Image, Image.id == image_m2m_tag.c.image_id) \
+        .filter(image_m2m_tag.c.tag_id.in_(tag_ids), image_m2m_tag.c.image_id > after_id, Image.url.isnot(None)) \
+        .group_by(image_m2m_tag.c.image_id)
+    if match_all:
+        stmt = stmt.having(func.count() == len(tag_ids))
+    result = await db.execute(stmt.order_by(image_m2m_tag.c.image_id).limit(limit))
+    image_ids = result.scalars().all()
+    if not image_ids:
+        return []
+
+    result = await db.execute(select(Image).options(raiseload("*")).filter(Image.id.in_(image_ids)).order_by(Image.id))
+    return result.scalars().all()
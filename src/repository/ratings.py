@@ -1,60 +1,144 @@
 from typing import List
 
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, raiseload
 
-
-from src.database.models import Rating, User
+from src.database.db import get_insert
+from src.database.models import Rating, User, Image, ImageRatingStats
 from src.schemas.rating_schemas import RatingModel
-
-DICT_WITH_STARS = {"one_star": 1, "two_stars": 2, "three_stars": 3, "four_srats": 4, "five_stars": 5}
-
-
-async def get_average_rating(image_id, db: Session):
-    ratings = db.query(Rating).filter(Rating.image_id == image_id).all()
-    if len(ratings) == 0:
+from src.services.response_cache import response_cache
+
+STAR_COLUMNS = {1: "one_star", 2: "two_stars", 3: "three_stars", 4: "four_stars", 5: "five_stars"}
+MAX_IMAGES_PER_BATCH = 200
+
+
+async def update_rating_stats(image_id: int, db: AsyncSession, added: int | None = None,
+                              removed: int | None = None) -> None:
+    """
+    The update_rating_stats function applies a rating change to the per-image aggregate
+    in the current transaction. The row is created on the first rating of the image.
+
+    :param image_id: int: The image whose aggregate changes
+    :param db: AsyncSession: The database session
+    :param added: int | None: Stars of a rating that was added
+    :param removed: int | None: Stars of a rating that was removed
+    :return: Nothing
+    """
+    deltas = {"rating_sum": 0, "rating_count": 0}
+    if added:
+        deltas["rating_sum"] += added
+        deltas["rating_count"] += 1
+        deltas[STAR_COLUMNS[added]] = deltas.get(STAR_COLUMNS[added], 0) + 1
+    if removed:
+        deltas["rating_sum"] -= removed
+        deltas["rating_count"] -= 1
+        deltas[STAR_COLUMNS[removed]] = deltas.get(STAR_COLUMNS[removed], 0) - 1
+
+    stats = ImageRatingStats.__table__
+    insert = get_insert(db)
+    stmt = insert(stats).values(image_id=image_id, **deltas)
+    stmt = stmt.on_conflict_do_update(index_elements=[stats.c.image_id],
+                                      set_={key: stats.c[key] + value for key, value in deltas.items()})
+    await db.execute(stmt)
+
+
+async def get_average_rating(image_id, db: AsyncSession) -> float:
+    result = await db.execute(select(ImageRatingStats.rating_sum, ImageRatingStats.rating_count)
+                              .filter(ImageRatingStats.image_id == image_id))
+    stats = result.first()
+    if stats is None or stats.rating_count == 0:
         return 0
-    sum_user_rating = 0
-    for element in ratings:
-        for key, value in element.items():
-            if value:
-                sum_user_rating += DICT_WITH_STARS[key]
-    average_user_rating = sum_user_rating / len(ratings)
-    return average_user_rating
-
-
-async def get_rating(rating_id: int, db: Session) -> Rating:
-    return db.query(Rating).filter(Rating.id == rating_id).first()
-
-
-async def create_rating_from_user(image_id, body: RatingModel, user: User, db: Session) -> Rating | None:
-    if user.id == body.user_id:
+    return stats.rating_sum / stats.rating_count
+
+
+async def get_average_ratings(image_ids: List[int], db: AsyncSession) -> List[dict]:
+    """
+    The get_average_ratings function returns the average rating for every requested image
+    with a single lookup in the aggregate table. Images without ratings get 0.
+
+    :param image_ids: List[int]: The images to look up, in the order of the response
+    :param db: AsyncSession: The database session
+    :return: A list of dictionaries with image_id, average_rating and rating_count
+    """
+    result = await db.execute(select(ImageRatingStats.image_id, ImageRatingStats.rating_sum,
+                                     ImageRatingStats.rating_count)
+                              .filter(ImageRatingStats.image_id.in_(image_ids)))
+    stats = {row.image_id: row for row in result.all()}
+    averages = []
+    for image_id in image_ids:
+        row = stats.get(image_id)
+        count = row.rating_count if row else 0
+        averages.append({"image_id": image_id,
+                         "average_rating": row.rating_sum / count if count else 0,
+                         "rating_count": count})
+    return averages
+
+
+async def get_ratings(image_id: int, after_id: int | None, limit: int, db: AsyncSession) -> List[Rating]:
+    """
+    The get_ratings function returns a page of the ratings of an image with their users, ordered by id
+    and paged with the after_id cursor. The users are joined in the same query.
+
+    :param image_id: int: The rated image
+    :param after_id: int | None: Only ratings with a bigger id are returned
+    :param limit: int: The page size
+    :param db: AsyncSession: The database session
+    :return: A list of ratings
+    """
+    stmt = select(Rating).options(joinedload(Rating.user), raiseload("*")).filter(Rating.image_id == image_id)
+    if after_id is not None:
+        stmt = stmt.filter(Rating.id > after_id)
+    result = await db.execute(stmt.order_by(Rating.id).limit(limit))
+    return result.scalars().all()
+
+
+async def get_rating(rating_id: int, db: AsyncSession, for_update: bool = False) -> Rating:
+    stmt = select(Rating).options(joinedload(Rating.user), raiseload("*")).filter(Rating.id == rating_id)
+    if for_update:
+        # lock the row so concurrent changes of the same rating apply their deltas one after another
+        stmt = stmt.with_for_update(of=Rating)
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+
+async def create_rating_from_user(image_id: int, body: RatingModel, user: User, db: AsyncSession) -> Rating | None:
+    image = await db.get(Image, image_id)
+    if image is None or image.user_id == user.id:
         return None
-    rating_in_database = db.query(Rating).filter(Rating.image_id == image_id, Rating.user_id ==  body.user_id).first()
-    if rating_in_database:
+    result = await db.execute(select(Rating.id).filter(Rating.image_id == image_id, Rating.user_id == user.id))
+    if result.first():
         return None
-    rating_from_user = Rating(rating=body.rating.dict())
-    db.add(rating_from_user)
-    db.commit()
-    db.refresh(rating_from_user)
-    return rating_from_user
-
+    rating_from_user = Rating(rating=body.rating, user_id=user.id, image_id=image_id)
+    try:
+        db.add(rating_from_user)
+        await update_rating_stats(image_id, db, added=body.rating)
+        await db.commit()
+    except IntegrityError:
+        # a concurrent request of the same user rated the image first, the aggregate is rolled back too
+        await db.rollback()
+        return None
+    await response_cache.invalidate(f"rating:{image_id}")
+    return await get_rating(rating_from_user.id, db)
 
 
-async def update_rating(rating_id: int, body: RatingModel, db: Session) -> Rating | None:
-    rating = db.query(Rating).filter(Rating.id == rating_id).first()
+async def update_rating(rating_id: int, body: RatingModel, db: AsyncSession) -> Rating | None:
+    rating = await get_rating(rating_id, db, for_update=True)
     if rating:
-        rating.rating = body.rating.dict()
-        db.commit()
+        if rating.rating != body.rating:
+            await update_rating_stats(rating.image_id, db, added=body.rating, removed=rating.rating)
+            rating.rating = body.rating
+        await db.commit()
+        await response_cache.invalidate(f"rating:{rating.image_id}")
     return rating
 
 
-
-async def remove_rating(rating_id: int, db: Session)  -> Rating | None:
-    rating = db.query(Rating).filter(Rating.id == rating_id).first()
+async def remove_rating(rating_id: int, db: AsyncSession) -> Rating | None:
+    rating = await get_rating(rating_id, db, for_update=True)
     if rating:
-        db.delete(rating)
-        db.commit()
+        await update_rating_stats(rating.image_id, db, removed=rating.rating)
+        await db.delete(rating)
+        await db.commit()
+        await response_cache.invalidate(f"rating:{rating.image_id}")
     return rating
-
-
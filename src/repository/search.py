@@ -0,0 +1,69 @@
+import re
+from typing import List
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, raiseload
+
+from src.database.models import Image, Comment
+from src.database.search import SEARCH_CONFIG
+
+MAX_TERMS = 10
+
+
+def search_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+async def _ranked_ids(table: str, terms: List[str], limit: int, offset: int, db: AsyncSession) -> List[int]:
+    """
+    The _ranked_ids function returns one page of the ids of the rows matching every term, best match first.
+    The page is ranked on the full-text index alone, only the rows of the page are loaded afterwards.
+
+    :param table: str: The searched table, images or comments
+    :param terms: List[str]: The search terms
+    :param limit: int: The page size
+    :param offset: int: The number of skipped matches
+    :param db: AsyncSession: The database session
+    :return: A list of ids
+    """
+    if db.bind.dialect.name == "sqlite":
+        # every term is quoted, so the FTS5 query syntax in user input is never interpreted
+        stmt = text(f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH :query "
+                    f"ORDER BY rank, rowid LIMIT :limit OFFSET :offset")
+        query = " ".join(f'"{term}"' for term in terms)
+    else:
+        stmt = text(f"SELECT id FROM {table}, plainto_tsquery('{SEARCH_CONFIG}', :query) AS query "
+                    f"WHERE search_vector @@ query "
+                    f"ORDER BY ts_rank_cd(search_vector, query) DESC, id LIMIT :limit OFFSET :offset")
+        query = " ".join(terms)
+    result = await db.execute(stmt, {"query": query, "limit": limit, "offset": offset})
+    return result.scalars().all()
+
+
+def _in_order(rows, ids: List[int]) -> list:
+    by_id = {row.id: row for row in rows}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+
+async def search_images(query: str, limit: int, offset: int, db: AsyncSession) -> List[Image]:
+    terms = search_terms(query)
+    if not terms:
+        return []
+    ids = await _ranked_ids(Image.__tablename__, terms, limit, offset, db)
+    if not ids:
+        return []
+    result = await db.execute(select(Image).options(raiseload("*")).filter(Image.id.in_(ids), Image.url.isnot(None)))
+    return _in_order(result.scalars().all(), ids)
+
+
+async def search_comments(query: str, limit: int, offset: int, db: AsyncSession) -> List[Comment]:
+    terms = search_terms(query)
+    if not terms:
+        return []
+    ids = await _ranked_ids(Comment.__tablename__, terms, limit, offset, db)
+    if not ids:
+        return []
+    result = await db.execute(select(Comment).options(joinedload(Comment.user), raiseload("*"))
+                              .filter(Comment.id.in_(ids)))
+    return _in_order(result.scalars().all(), ids)
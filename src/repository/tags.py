@@ -1,48 +1,115 @@
 from typing import List, Type
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import Tag
+from src.database.db import get_insert
+from src.database.models import Tag, image_m2m_tag
 from src.schemas.tag_schemas import TagModel
+from src.services.response_cache import response_cache
+from src.services.tag_index import tag_index
+from src.services.tag_postings import posting_lists
 
 
-async def get_tags(skip: int, limit: int, db: Session) -> List[Type[Tag]]:
-    return db.query(Tag).offset(skip).limit(limit).all()
+async def get_tags(after_id: int | None, limit: int, db: AsyncSession) -> List[Type[Tag]]:
+    stmt = select(Tag)
+    if after_id is not None:
+        stmt = stmt.filter(Tag.id > after_id)
+    result = await db.execute(stmt.order_by(Tag.id).limit(limit))
+    return result.scalars().all()
 
 
-async def get_tag(tag_id: int, db: Session) -> Type[Tag] | None:
-    return db.query(Tag).filter(Tag.id == tag_id).first()
+async def load_tag_index(db: AsyncSession) -> None:
+    # the tag writes of this process made while the query runs are replayed on the new index
+    tag_index.start_rebuild()
+    try:
+        result = await db.execute(select(Tag.id, Tag.name))
+        tags = result.all()
+    except BaseException:
+        tag_index.abort_rebuild()
+        raise
+    tag_index.rebuild(tags)
 
 
-async def create_tag(body: TagModel, db: Session) -> Tag:
+async def get_tag(tag_id: int, db: AsyncSession) -> Type[Tag] | None:
+    result = await db.execute(select(Tag).filter(Tag.id == tag_id))
+    return result.scalars().first()
+
+
+async def create_tag(body: TagModel, db: AsyncSession) -> Tag:
     tag = Tag(name=body.name)
     db.add(tag)
-    db.commit()
-    db.refresh(tag)
+    await db.commit()
+    await db.refresh(tag)
+    tag_index.add(tag.id, tag.name)
+    await response_cache.invalidate("tags")
     return tag
 
 
-async def update_tag(tag_id: int, body: TagModel, db: Session) -> Tag | None:
+async def update_tag(tag_id: int, body: TagModel, db: AsyncSession) -> Tag | None:
     #if user.role in ["administrator", "moderator"]:
-    tag = db.query(Tag).filter(Tag.id == tag_id).first()
+    tag = await get_tag(tag_id, db)
     if tag:
+        old_name = tag.name
         tag.name = body.name
-        db.commit()
+        await db.commit()
+        tag_index.rename(tag.id, old_name, tag.name)
+        await response_cache.invalidate("tags", f"tag:{tag.id}")
     return tag
 
 
-async def remove_tag(tag_id: int, db: Session) -> Tag | None:
+async def remove_tag(tag_id: int, db: AsyncSession) -> Tag | None:
     # if user.role in ["administrator", "moderator"]:
-    tag = db.query(Tag).filter(Tag.id == tag_id).first()
+    tag = await get_tag(tag_id, db)
     if tag:
-        db.delete(tag)
-        db.commit()
+        await db.delete(tag)
+        await db.commit()
+        tag_index.remove(tag.id, tag.name)
+        await response_cache.invalidate("tags", f"tag:{tag.id}")
     return tag
 
-async def remove_tag(tag_id: int, db: Session) -> Tag | None:
-    # if user.role in ["administrator", "moderator"]:
-    tag = db.query(Tag).filter(Tag.id == tag_id).first()
-    if tag:
-        db.delete(tag)
-        db.commit()
-    return tag
+
+async def get_image_tags(image_id: int, db: AsyncSession) -> List[Tag]:
+    result = await db.execute(select(Tag).join(image_m2m_tag, image_m2m_tag.c.tag_id == Tag.id)
+                              .filter(image_m2m_tag.c.image_id == image_id).order_by(Tag.name))
+    return result.scalars().all()
+
+
+async def attach_tags(image_id: int, names: List[str], db: AsyncSession) -> List[Tag]:
+    """
+    The attach_tags function attaches tags to an image, creating the tags that do not exist yet.
+    Tags that are already attached are skipped.
+
+    :param image_id: int: The image to tag
+    :param names: List[str]: The names of the tags
+    :param db: AsyncSession: The database session
+    :return: All tags of the image
+    """
+    insert = get_insert(db)
+    tags = Tag.__table__
+    result = await db.execute(insert(tags).values([{"name": name} for name in names])
+                              .on_conflict_do_nothing(index_elements=[tags.c.name])
+                              .returning(tags.c.id, tags.c.name))
+    created = result.all()
+    result = await db.execute(select(Tag.id).filter(Tag.name.in_(names)))
+    tag_ids = result.scalars().all()
+    await db.execute(insert(image_m2m_tag).values([{"image_id": image_id, "tag_id": tag_id} for tag_id in tag_ids])
+                     .on_conflict_do_nothing(index_elements=[image_m2m_tag.c.image_id, image_m2m_tag.c.tag_id]))
+    await db.commit()
+    for tag_id, name in created:
+        tag_index.add(tag_id, name)
+    if created:
+        await response_cache.invalidate("tags")
+    posting_lists.invalidate(tag_ids)
+    return await get_image_tags(image_id, db)
+
+
+async def detach_tags(image_id: int, names: List[str], db: AsyncSession) -> List[Tag]:
+    result = await db.execute(select(Tag.id).filter(Tag.name.in_(names)))
+    tag_ids = result.scalars().all()
+    if tag_ids:
+        await db.execute(delete(image_m2m_tag).filter(image_m2m_tag.c.image_id == image_id,
+                                                      image_m2m_tag.c.tag_id.in_(tag_ids)))
+        await db.commit()
+        posting_lists.invalidate(tag_ids)
+    return await get_image_tags(image_id, db)
@@ -1,17 +1,21 @@
-import cloudinary
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
 
-from src.database.models import TransformedImage, Image
-from src.database.db import get_db
+from src.database.models import TransformedImage, Image, User
+from src.database.db import get_db, get_insert
 from src.schemas.transformed_image_schemas import TransformedImageModel
-from src.services.transformed_image import create_qrcode
+from src.services.response_cache import response_cache
+from src.services.storage import storage
+from src.services.transformed_image import normalize_transformations, transformation_key
 
 
-async def create_transformed_picture(body: TransformedImageModel, image_id: int, db: Session = Depends(get_db)):
-    original_image = db.query(Image).filter(Image.id == image_id).first()
-    print(original_image)
-    if not original_image:
+async def create_transformed_picture(body: TransformedImageModel, image_id: int, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(Image.public_name, User.username).join(User, Image.user_id == User.id)
+                              .filter(Image.id == image_id))
+    original_image = result.first()
+    if original_image is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Original image not found")
 
     transformations = []
@@ -27,55 +31,65 @@ async def create_transformed_picture(body: TransformedImageModel, image_id: int,
     if body.angle:
         angle = {'angle': body.angle}
         transformations.append(angle)
-    # if body.effect:
-    #     effect = {'effect': body.effect}
-    #     transformations.append(effect)
-
-    print(transformations)
-
-    public_id = original_image.public_name
-    print(public_id)
-    new_url = cloudinary.CloudinaryImage(public_id).build_url(transformation=transformations)
-
-    # check is there such transformed image in the database already
-    transformed_list = db.query(TransformedImage).filter(TransformedImage.image_id == image_id).all()
-    if any([image.transform_image_url == new_url for image in transformed_list]):
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="This transformed images is already exists")
-
-    new_transformed_image = TransformedImage(transform_image_url=new_url, image_id=original_image.id)
-    db.add(new_transformed_image)
-    db.commit()
-    db.refresh(new_transformed_image)
-    return new_transformed_image
-
-
-async def get_all_transformed_images(skip: int, limit: int, image_id: int, db: Session):
-    transformed_list = db.query(TransformedImage).filter(TransformedImage.image_id == image_id).offset(skip).limit(
-        limit).all()
-    if not transformed_list:
+    if body.effect:
+        effect = {'effect': body.effect}
+        transformations.append(effect)
+
+    transformations = normalize_transformations(transformations)
+    key = transformation_key(transformations)
+    # the key the original was stored under by the upload
+    public_id = f"PhotoShare/{original_image.public_name}_{original_image.username}"
+    new_url = storage.url(public_id, transformation=transformations)
+
+    # insert the transformation or, when the image already has it, return the existing one
+    insert = get_insert(db)
+    stmt = insert(TransformedImage).values(transform_image_url=new_url, transformation_key=key, image_id=image_id)
+    stmt = stmt.on_conflict_do_nothing(index_elements=[TransformedImage.image_id, TransformedImage.transformation_key])
+    result = await db.execute(stmt.returning(TransformedImage.id))
+    new_id = result.scalar()
+    await db.commit()
+    if new_id is not None:
+        await response_cache.invalidate(f"transformed:{image_id}")
+        return await db.get(TransformedImage, new_id)
+    result = await db.execute(select(TransformedImage).filter(TransformedImage.image_id == image_id,
+                                                              TransformedImage.transformation_key == key))
+    return result.scalars().first()
+
+
+async def get_all_transformed_images(after_id: int | None, limit: int, image_id: int, db: AsyncSession):
+    stmt = select(TransformedImage).options(raiseload("*")).filter(TransformedImage.image_id == image_id)
+    if after_id is not None:
+        stmt = stmt.filter(TransformedImage.id > after_id)
+    result = await db.execute(stmt.order_by(TransformedImage.id).limit(limit))
+    transformed_list = result.scalars().all()
+    if not transformed_list and after_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transformed images for this image not found")
     return transformed_list
 
 
-async def get_transformed_image_by_id(transformed_id: int, db: Session):
-    transformed_image = db.query(TransformedImage).filter(TransformedImage.id == transformed_id).first()
+async def get_transformed_image_by_id(transformed_id: int, db: AsyncSession):
+    result = await db.execute(select(TransformedImage).filter(TransformedImage.id == transformed_id))
+    transformed_image = result.scalars().first()
     if not transformed_image:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transformed image not found")
     return transformed_image
 
 
-async def delete_transformed_image_by_id(transformed_id: int, db: Session):
-    transformed_image = db.query(TransformedImage).filter(TransformedImage.id == transformed_id).first()
+async def delete_transformed_image_by_id(transformed_id: int, db: AsyncSession):
+    result = await db.execute(select(TransformedImage).filter(TransformedImage.id == transformed_id))
+    transformed_image = result.scalars().first()
     if not transformed_image:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transformed image not found")
-    db.delete(transformed_image)
-    db.commit()
+    await db.delete(transformed_image)
+    await db.commit()
+    await response_cache.invalidate(f"transformed:{transformed_image.image_id}")
     return transformed_image
 
 
-async def get_qrcode_transformed_image_by_id(transformed_id: int, db: Session):
-    transformed_image = db.query(TransformedImage).filter(TransformedImage.id == transformed_id).first()
+async def get_qrcode_transformed_image_by_id(transformed_id: int, db: AsyncSession):
+    result = await db.execute(select(TransformedImage).filter(TransformedImage.id == transformed_id))
+    transformed_image = result.scalars().first()
     if not transformed_image:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transformed image not found")
     url_to_qrcode = transformed_image.transform_image_url
-    return create_qrcode(url_to_qrcode)
\ No newline at end of file
+    return url_to_qrcode
@@ -1,33 +1,37 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas.user_schemas import UserModel
+from src.services.user_cache import user_cache
 
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
+async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user associated with that email. If no such user exists, it returns None.
 
     :param email: str: Pass the email address of the user to be retrieved
-    :param db: Session: Pass in a database session
+    :param db: AsyncSession: Pass in a database session
     :return: A user object or none
     :doc-author: Trelent
     """
-    return db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).filter(User.email == email))
+    return result.scalars().first()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
     The create_user function creates a new user in the database.
         If there are no users with admin role, then the new user will be created as an admin.
         Otherwise, it will be created as a regular user.
 
     :param body: UserModel: Create a new user object
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A user object
     """
-    admin_exists = db.query(User).filter(User.role == 'admin').first()
+    result = await db.execute(select(User).filter(User.role == 'admin'))
+    admin_exists = result.scalars().first()
 
     if admin_exists:
         new_user = User(**body.dict(), role='user')
@@ -35,33 +39,49 @@ async def create_user(body: UserModel, db: Session) -> User:
         new_user = User(**body.dict(),  role='admin')
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
     The update_token function updates the refresh token for a user.
 
     :param user: User: Identify the user that is being updated
     :param token: str | None: Pass in the token that is returned from the api
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: Nothing
     """
     user.refresh_token = token
-    db.commit()
+    await db.commit()
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def update_password(user: User, password_hash: str, db: AsyncSession) -> None:
+    """
+    The update_password function stores a new password hash for a user
+    and drops the user from the user cache.
+
+    :param user: User: The user whose password changes
+    :param password_hash: str: The new password hash
+    :param db: AsyncSession: Access the database
+    :return: Nothing
+    """
+    user.password = password_hash
+    await db.commit()
+    await user_cache.invalidate(user.email)
+
+
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function takes in an email and a database session,
     and sets the confirmed field of the user with that email to True.
 
     :param email: str: Pass the email of the user to be confirmed
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: Nothing
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
@@ -0,0 +1,38 @@
+from typing import Dict
+
+from fastapi import APIRouter, Depends
+
+from src.database.db import get_pool_status
+from src.database.models import User, Role
+from src.schemas.admin_schemas import PoolStatusResponse, CacheCountersResponse
+from src.services.auth import auth_service
+from src.services.response_cache import response_cache
+from src.services.roles import RolesAccess
+
+router = APIRouter(prefix='/admin', tags=["admin"])
+
+access_get = RolesAccess([Role.admin])
+
+
+@router.get("/db_pool", response_model=PoolStatusResponse, dependencies=[Depends(access_get)])
+async def read_db_pool_status(_: User = Depends(auth_service.get_current_user)):
+    """
+    The read_db_pool_status function returns the state of the database connection pool:
+    checked out connections, overflow, checkout wait times and pool timeouts.
+
+    :param _: User: Make sure the endpoint is called by an authenticated user
+    :return: The pool status
+    """
+    return get_pool_status()
+
+
+@router.get("/response_cache", response_model=Dict[str, CacheCountersResponse], dependencies=[Depends(access_get)])
+async def read_response_cache_stats(_: User = Depends(auth_service.get_current_user)):
+    """
+    The read_response_cache_stats function returns the hit, miss and 304 counters of the response cache
+    of this process, grouped by the kind of the cached response (tags, comments, rating, transformed).
+
+    :param _: User: Make sure the endpoint is called by an authenticated user
+    :return: The counters
+    """
+    return response_cache.stats()
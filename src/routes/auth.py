@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.repository import users as repository_users
@@ -15,7 +15,7 @@ security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
         It takes a UserModel object as input, which is validated by pydantic.
@@ -25,27 +25,27 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
     :param body: UserModel: Pass the data from the request body to our function
     :param background_tasks: BackgroundTasks: Add a task to the background queue
     :param request: Request: Get the base url of the application
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A user object
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=AuthMessages.account_already_exists)
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
     background_tasks.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
     return new_user
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
         It takes the username and password from the request body,
         verifies that they are correct, and returns an access token.
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A json response with the access token and refresh token
     """
     user = await repository_users.get_user_by_email(body.username, db)
@@ -53,8 +53,11 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=AuthMessages.invalid_email)
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=AuthMessages.email_not_confirmed)
-    if not auth_service.verify_password(body.password, user.password):
+    valid, new_password_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=AuthMessages.invalid_password)
+    if new_password_hash:
+        await repository_users.update_password(user, new_password_hash, db)
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
@@ -63,14 +66,14 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns an access_token, a new refresh_token, and the type of token.
         If the user's current refresh_token does not match what was passed into this function then it will return an error.
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dictionary with the access_token, refresh_token and token type
     """
     token = credentials.credentials
@@ -87,7 +90,7 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
 
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
     It takes the token from the URL and uses it to get the user's email address.
@@ -97,7 +100,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     confirmed_email function which sets the 'confirmed' field of that particular record to
 
     :param token: str: Get the token from the url
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A message that the email is already confirmed or a message that it has been confirmed
     """
     email = await auth_service.get_email_from_token(token)
@@ -112,7 +115,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that will allow them
     to confirm their account. The function takes in a RequestEmail object, which contains the email of
@@ -123,7 +126,7 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     :param body: RequestEmail: Get the email from the request body
     :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the server
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message to the user
     """
     user = await repository_users.get_user_by_email(body.email, db)
@@ -1,14 +1,15 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, Path, HTTPException, status
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Path, Query, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User, Role
 from src.schemas.comment_schemas import CommentResponse, CommentModel, CommentDeleteResponse
 from src.repository import comments as repository_comments
 from src.services.auth import auth_service
+from src.services.rate_limiter import RateLimit
+from src.services.response_cache import response_cache
 from src.services.roles import RolesAccess
 
 router = APIRouter(prefix='/comments', tags=['comments'])
@@ -20,14 +21,18 @@ access_delete = RolesAccess([Role.admin, Role.moderator])
 
 
 @router.get('/', response_model=List[CommentResponse],
-            dependencies=[Depends(RateLimiter(times=5, seconds=2)), Depends(access_get)])
-async def get_comments(db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
-    comments = await repository_comments.get_comments(db)
-    return comments
+            dependencies=[Depends(RateLimit("comments:list")), Depends(access_get)])
+async def get_comments(request: Request, after_id: int | None = Query(None, ge=0),
+                       limit: int = Query(20, ge=1, le=100),
+                       image_id: int | None = Query(None, ge=1), db: AsyncSession = Depends(get_db),
+                       _: User = Depends(auth_service.get_current_user)):
+    namespace = "comments" if image_id is None else f"comments:{image_id}"
+    return await response_cache.respond(request, [namespace], List[CommentResponse],
+                                        lambda: repository_comments.get_comments(after_id, limit, image_id, db))
 
 
 @router.get('/{comment_id}', response_model=CommentResponse, dependencies=[Depends(access_get)])
-async def get_comment_by_id(comment_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def get_comment_by_id(comment_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                             _: User = Depends(auth_service.get_current_user)):
     comment = await repository_comments.get_comment_by_id(comment_id, db)
     if not comment:
@@ -36,8 +41,8 @@ async def get_comment_by_id(comment_id: int = Path(ge=1), db: Session = Depends(
 
 
 @router.post('/', response_model=CommentResponse, status_code=status.HTTP_201_CREATED,
-             dependencies=[Depends(RateLimiter(times=2, seconds=5)), Depends(access_create)])
-async def create_comment(body: CommentModel, db: Session = Depends(get_db),
+             dependencies=[Depends(RateLimit("comments:create")), Depends(access_create)])
+async def create_comment(body: CommentModel, db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     body.user_id = current_user.id
     comment = await repository_comments.create_comment(body, db)
@@ -45,7 +50,7 @@ async def create_comment(body: CommentModel, db: Session = Depends(get_db),
 
 
 @router.put('/{comment_id}', response_model=CommentResponse, dependencies=[Depends(access_update)])
-async def update_comment(body: CommentModel, comment_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def update_comment(body: CommentModel, comment_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     if current_user.id != body.user_id and current_user.role == 'user':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You can't change not your comment")
@@ -56,7 +61,7 @@ async def update_comment(body: CommentModel, comment_id: int = Path(ge=1), db: S
 
 
 @router.delete('/{comment_id}', response_model=CommentDeleteResponse, dependencies=[Depends(access_delete)])
-async def remove_comment(comment_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def remove_comment(comment_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          _: User = Depends(auth_service.get_current_user)):
     comment = await repository_comments.remove_comment(comment_id, db)
     if not comment:
@@ -1,20 +1,22 @@
-import os
+import asyncio
+from typing import List
 
-import cloudinary
-import cloudinary.uploader
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
-from sqlalchemy.orm import Session
-from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.conf.config import settings
 from src.database.db import get_db
-from src.database.models import User, Role
-from src.schemas.image_schemas import ImageAddResponse, ImageUpdateModel
+from src.database.models import User, Role, Image
+from src.schemas.image_schemas import ImageAddResponse, ImagesAddResponse, ImageUpdateModel, ImageDb, ImageTagsModel
+from src.schemas.tag_schemas import TagResponse
 from src.repository import images
+from src.repository import tags as repository_tags
 from src.services.auth import auth_service
-from src.services.images import images_service_id_exists, images_service_change_name
+from src.services.image_engine import image_engine
+from src.services.images import images_service_id_exists, images_service_upload
 from src.services.roles import RolesAccess
-
-load_dotenv()
+from src.services.storage import storage, LocalStorage, CHUNK_SIZE
 
 router = APIRouter(prefix='/images', tags=["images"])
 
@@ -26,38 +28,159 @@ access_delete = RolesAccess([Role.admin, Role.moderator, Role.user])
 
 @router.post("/add", response_model=ImageAddResponse, status_code=status.HTTP_201_CREATED,
              dependencies=[Depends(access_create)])
-async def upload_image(description: str, file: UploadFile = File(), db: Session = Depends(get_db),
+async def upload_image(description: str, file: UploadFile = File(), db: AsyncSession = Depends(get_db),
                        current_user: User = Depends(auth_service.get_current_user)):
-    cloudinary.config(
-        cloud_name=os.environ.get('CLOUDINARY_NAME'),
-        api_key=os.environ.get('CLOUDINARY_API_KEY'),
-        api_secret=os.environ.get('CLOUDINARY_API_SECRET'),
-        secure=True
-    )
-
     public_name = file.filename.split(".")[0]
 
-    correct_public_name = await images_service_change_name(public_name, db)
+    image = await images.add_image(db, description, None, public_name, current_user)
 
-    file_name = correct_public_name + "_" + str(current_user.username)
-    r = cloudinary.uploader.upload(file.file, public_id=f'PhotoShare/{file_name}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'PhotoShare/{file_name}') \
-        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
+    file_name = image.public_name + "_" + str(current_user.username)
+    try:
+        src_url = await images_service_upload(file.file, file_name)
+    except Exception:
+        await images.remove_images(db, [image])
+        raise
 
-    image = await images.add_image(db, description, src_url, correct_public_name, current_user)
+    image, = await images.update_image_urls(db, [image], [src_url])
 
     return {"image": image, "detail": "Image was successfully added"}
 
 
+@router.post("/add_many", response_model=ImagesAddResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(access_create)])
+async def upload_images(description: str, files: List[UploadFile] = File(), db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    if len(files) > settings.upload_max_files:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"No more than {settings.upload_max_files} files per request")
+
+    public_names = [file.filename.split(".")[0] for file in files]
+    user_images = await images.add_images(db, description, public_names, current_user)
+
+    try:
+        src_urls = await asyncio.gather(*[
+            images_service_upload(file.file, image.public_name + "_" + str(current_user.username))
+            for file, image in zip(files, user_images)
+        ])
+    except Exception:
+        await images.remove_images(db, user_images)
+        raise
+
+    user_images = await images.update_image_urls(db, user_images, src_urls)
+
+    return {"images": user_images, "detail": "Images were successfully added"}
+
+
+def _parse_range(range_header: str, file_size: int) -> tuple[int, int]:
+    unit, _, byte_range = range_header.partition("=")
+    start, _, end = byte_range.partition("-")
+    if unit.strip() != "bytes" or "," in byte_range:
+        raise ValueError(range_header)
+    if start:
+        start, end = int(start), min(int(end), file_size - 1) if end else file_size - 1
+    else:
+        start, end = max(file_size - int(end), 0), file_size - 1
+    if start > end:
+        raise ValueError(range_header)
+    return start, end
+
+
+def _iter_file(path, start: int, end: int):
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@router.get("/files/{key:path}")
+async def get_image_file(key: str, request: Request, transformation: str | None = Query(None, max_length=255)):
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Files are served by the storage backend")
+    try:
+        path = storage.path(key)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    if not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    if transformation:
+        try:
+            path = await image_engine.get(path, transformation)
+        except ValueError as err:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+        media_type = "image/jpeg"
+    else:
+        media_type = storage.media_type(key)
+    file_size = path.stat().st_size
+    range_header = request.headers.get("range")
+    if not range_header:
+        return FileResponse(path, media_type=media_type, headers={"Accept-Ranges": "bytes"})
+    try:
+        start, end = _parse_range(range_header, file_size)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                            detail="Invalid range", headers={"Content-Range": f"bytes */{file_size}"})
+    headers = {"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{file_size}",
+               "Content-Length": str(end - start + 1)}
+    return StreamingResponse(_iter_file(path, start, end), status_code=status.HTTP_206_PARTIAL_CONTENT,
+                             media_type=media_type, headers=headers)
+
+
 @router.get("", dependencies=[Depends(access_get)])
-async def get_images(db: Session = Depends(get_db),
+async def get_images(db: AsyncSession = Depends(get_db),
                      current_user: User = Depends(auth_service.get_current_user)):
     user_images = await images.get_images(db, current_user)
     return user_images
 
 
+@router.get("/search", response_model=List[ImageDb], dependencies=[Depends(access_get)])
+async def search_images(tags: List[str] = Query(..., min_items=1, max_items=10),
+                        mode: str = Query("all", regex="^(all|any)$"),
+                        after_id: int | None = Query(None, ge=0), limit: int = Query(50, ge=1, le=200),
+                        db: AsyncSession = Depends(get_db)):
+    tag_names = [tag.strip() for tag in tags if tag.strip()]
+    if not tag_names:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No tags to search by")
+    return await images.search_images_by_tags(tag_names, mode == "all", after_id, limit, db)
+
+
+async def _get_tagged_image(image_id: int, db: AsyncSession, user: User):
+    image = await db.get(Image, image_id)
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    if image.user_id != user.id and user.role not in (Role.admin, Role.moderator):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation forbidden")
+    return image
+
+
+@router.get("/{image_id}/tags", response_model=List[TagResponse], dependencies=[Depends(access_get)])
+async def get_image_tags(image_id: int, db: AsyncSession = Depends(get_db)):
+    if not await images_service_id_exists(image_id, db):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return await repository_tags.get_image_tags(image_id, db)
+
+
+@router.post("/{image_id}/tags", response_model=List[TagResponse], dependencies=[Depends(access_update)])
+async def attach_image_tags(image_id: int, body: ImageTagsModel, db: AsyncSession = Depends(get_db),
+                            current_user: User = Depends(auth_service.get_current_user)):
+    await _get_tagged_image(image_id, db, current_user)
+    return await repository_tags.attach_tags(image_id, list(dict.fromkeys(body.tags)), db)
+
+
+@router.delete("/{image_id}/tags", response_model=List[TagResponse], dependencies=[Depends(access_update)])
+async def detach_image_tags(image_id: int, body: ImageTagsModel, db: AsyncSession = Depends(get_db),
+                            current_user: User = Depends(auth_service.get_current_user)):
+    await _get_tagged_image(image_id, db, current_user)
+    return await repository_tags.detach_tags(image_id, list(dict.fromkeys(body.tags)), db)
+
+
 @router.get("/{image_id}", dependencies=[Depends(access_get)])
-async def get_image(id: int, db: Session = Depends(get_db),
+async def get_image(id: int, db: AsyncSession = Depends(get_db),
                     current_user: User = Depends(auth_service.get_current_user)):
     id_exists = await images_service_id_exists(id, db)
     if id_exists:
@@ -68,7 +191,7 @@ async def get_image(id: int, db: Session = Depends(get_db),
 
 
 @router.put("/{image_info.id}", dependencies=[Depends(access_update)])
-async def update_image(image_info: ImageUpdateModel, db: Session = Depends(get_db),
+async def update_image(image_info: ImageUpdateModel, db: AsyncSession = Depends(get_db),
                        current_user: User = Depends(auth_service.get_current_user)):
     id_exists = await images_service_id_exists(image_info.id, db)
     if id_exists:
@@ -79,7 +202,7 @@ async def update_image(image_info: ImageUpdateModel, db: Session = Depends(get_d
 
 
 @router.delete("/{id}", dependencies=[Depends(access_delete)])
-async def delete_image(id: int, db: Session = Depends(get_db),
+async def delete_image(id: int, db: AsyncSession = Depends(get_db),
                        current_user: User = Depends(auth_service.get_current_user)):
     id_exists = await images_service_id_exists(id, db)
     if id_exists:
@@ -1,15 +1,16 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User, Role
-from src.schemas.rating_schemas import RatingModel, RatingResponse
+from src.schemas.rating_schemas import RatingModel, RatingResponse, AverageRatingResponse
 from src.repository import ratings as repository_ratings
 from src.conf.messages import AuthMessages
 
 from src.services.auth import auth_service
+from src.services.response_cache import response_cache
 from src.services.roles import RolesAccess
 
 router = APIRouter(prefix='/ratings', tags=["ratings"])
@@ -20,15 +21,35 @@ access_update = RolesAccess([Role.admin, Role.moderator, Role.user])
 access_delete = RolesAccess([Role.admin, Role.moderator])
 
 
-@router.get("/image/{image_id}", response_model=int, dependencies=[Depends(access_get)])
-async def get_common_rating(image_id: int, db: Session = Depends(get_db),
+@router.get("/image/{image_id}", response_model=float, dependencies=[Depends(access_get)])
+async def get_common_rating(request: Request, image_id: int, db: AsyncSession = Depends(get_db),
                             current_user: User = Depends(auth_service.get_current_user)):
-    tags = await repository_ratings.get_average_rating(image_id, db)
-    return tags
+    return await response_cache.respond(request, [f"rating:{image_id}"], float,
+                                        lambda: repository_ratings.get_average_rating(image_id, db))
+
+
+@router.get("/image/{image_id}/list", response_model=List[RatingResponse], dependencies=[Depends(access_get)])
+async def get_image_ratings(request: Request, image_id: int = Path(ge=1), after_id: int | None = Query(None, ge=0),
+                            limit: int = Query(20, ge=1, le=100), db: AsyncSession = Depends(get_db),
+                            current_user: User = Depends(auth_service.get_current_user)):
+    return await response_cache.respond(request, [f"rating:{image_id}"], List[RatingResponse],
+                                        lambda: repository_ratings.get_ratings(image_id, after_id, limit, db))
+
+
+@router.get("/images/average", response_model=List[AverageRatingResponse], dependencies=[Depends(access_get)])
+async def get_common_ratings(request: Request, image_ids: List[int] = Query(), db: AsyncSession = Depends(get_db),
+                             current_user: User = Depends(auth_service.get_current_user)):
+    image_ids = list(dict.fromkeys(image_ids))
+    if len(image_ids) > repository_ratings.MAX_IMAGES_PER_BATCH:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"No more than {repository_ratings.MAX_IMAGES_PER_BATCH} images per request")
+    return await response_cache.respond(request, [f"rating:{image_id}" for image_id in image_ids],
+                                        List[AverageRatingResponse],
+                                        lambda: repository_ratings.get_average_ratings(image_ids, db))
 
 
 @router.get("/{rating_id}", response_model=RatingResponse, dependencies=[Depends(access_get)])
-async def read_tag(rating_id: int, db: Session = Depends(get_db)):
+async def read_tag(rating_id: int, db: AsyncSession = Depends(get_db)):
     rating = await repository_ratings.get_rating(rating_id, db)
     if rating is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rating not found")
@@ -36,16 +57,17 @@ async def read_tag(rating_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/{image_id}", response_model=RatingResponse, dependencies=[Depends(access_create)])
-async def create_rating(image_id, body: RatingModel, db: Session = Depends(get_db),
+async def create_rating(image_id: int, body: RatingModel, db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
     rating = await repository_ratings.create_rating_from_user(image_id, body, current_user, db)
     if rating is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="You can't rate your images or rate more than 2 times")
+    return rating
 
 
 @router.put("/{rating_id}", response_model=RatingResponse, dependencies=[Depends(access_update)])
-async def update_rating(body: RatingModel, rating_id: int, db: Session = Depends(get_db),
+async def update_rating(body: RatingModel, rating_id: int, db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
     rating = await repository_ratings.update_rating(rating_id, body, db)
     if rating is None:
@@ -55,7 +77,7 @@ async def update_rating(body: RatingModel, rating_id: int, db: Session = Depends
 
 
 @router.delete("/{rating_id}", response_model=RatingResponse, dependencies=[Depends(access_delete)])
-async def remove_rating(rating_id: int, db: Session = Depends(get_db),
+async def remove_rating(rating_id: int, db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
     rating = await repository_ratings.remove_rating(rating_id, db)
     if rating is None:
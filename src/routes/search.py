@@ -0,0 +1,30 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import get_db
+from src.database.models import User, Role
+from src.repository import search as repository_search
+from src.schemas.comment_schemas import CommentResponse
+from src.schemas.image_schemas import ImageDb
+from src.services.auth import auth_service
+from src.services.roles import RolesAccess
+
+router = APIRouter(prefix='/search', tags=["search"])
+
+access_get = RolesAccess([Role.admin, Role.moderator, Role.user])
+
+
+@router.get("/images", response_model=List[ImageDb], dependencies=[Depends(access_get)])
+async def search_images(q: str = Query(min_length=1, max_length=100), limit: int = Query(20, ge=1, le=50),
+                        offset: int = Query(0, ge=0, le=1000), db: AsyncSession = Depends(get_db),
+                        _: User = Depends(auth_service.get_current_user)):
+    return await repository_search.search_images(q, limit, offset, db)
+
+
+@router.get("/comments", response_model=List[CommentResponse], dependencies=[Depends(access_get)])
+async def search_comments(q: str = Query(min_length=1, max_length=100), limit: int = Query(20, ge=1, le=50),
+                          offset: int = Query(0, ge=0, le=1000), db: AsyncSession = Depends(get_db),
+                          _: User = Depends(auth_service.get_current_user)):
+    return await repository_search.search_comments(q, limit, offset, db)
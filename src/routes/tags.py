@@ -1,7 +1,7 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User, Role
@@ -10,7 +10,9 @@ from src.repository import tags as repository_tags
 from src.conf.messages import AuthMessages
 
 from src.services.auth import auth_service
+from src.services.response_cache import response_cache
 from src.services.roles import RolesAccess
+from src.services.tag_index import tag_index
 
 router = APIRouter(prefix='/tags', tags=["tags"])
 
@@ -21,21 +23,33 @@ access_delete = RolesAccess([Role.admin, Role.moderator])
 
 
 @router.get("/", response_model=List[TagResponse], dependencies=[Depends(access_get)])
-async def read_tags(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
-    tags = await repository_tags.get_tags(skip, limit, db)
-    return tags
+async def read_tags(request: Request, after_id: int | None = Query(None, ge=0),
+                    limit: int = Query(100, ge=1, le=500),
+                    db: AsyncSession = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
+    return await response_cache.respond(request, ["tags"], List[TagResponse],
+                                        lambda: repository_tags.get_tags(after_id, limit, db))
+
+
+@router.get("/suggest", response_model=List[TagResponse], dependencies=[Depends(access_get)])
+async def suggest_tags(q: str = Query(min_length=1, max_length=25), limit: int = Query(10, ge=1, le=50),
+                       _: User = Depends(auth_service.get_current_user)):
+    return tag_index.suggest(q, limit)
 
 
 @router.get("/{tag_id}", response_model=TagResponse, dependencies=[Depends(access_get)])
-async def read_tag(tag_id: int, db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
-    tag = await repository_tags.get_tag(tag_id, db)
-    if tag is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tag not found")
-    return tag
+async def read_tag(request: Request, tag_id: int, db: AsyncSession = Depends(get_db),
+                   _: User = Depends(auth_service.get_current_user)):
+    async def load():
+        tag = await repository_tags.get_tag(tag_id, db)
+        if tag is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tag not found")
+        return tag
+
+    return await response_cache.respond(request, [f"tag:{tag_id}"], TagResponse, load)
 
 
 @router.post("/", response_model=TagResponse, dependencies=[Depends(access_create)])
-async def create_tag(body: TagModel, db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
+async def create_tag(body: TagModel, db: AsyncSession = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
     tag = await repository_tags.create_tag(body, db)
     if tag is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=AuthMessages.verification_error)
@@ -43,7 +57,7 @@ async def create_tag(body: TagModel, db: Session = Depends(get_db), _: User = De
 
 
 @router.put("/{tag_id}", response_model=TagResponse, dependencies=[Depends(access_update)])
-async def update_tag(body: TagModel, tag_id: int, db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
+async def update_tag(body: TagModel, tag_id: int, db: AsyncSession = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
     tag = await repository_tags.update_tag(tag_id, body, db)
     if tag is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
@@ -52,7 +66,7 @@ async def update_tag(body: TagModel, tag_id: int, db: Session = Depends(get_db),
 
 
 @router.delete("/{tag_id}", response_model=TagResponse, dependencies=[Depends(access_delete)])
-async def remove_tag(tag_id: int, db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
+async def remove_tag(tag_id: int, db: AsyncSession = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
     tag = await repository_tags.remove_tag(tag_id, db)
     if tag is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
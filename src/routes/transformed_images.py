@@ -1,48 +1,60 @@
 from typing import List
 
-from fastapi import APIRouter, Path, status, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Path, Query, Request, Response, status, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
-from src.schemas.transformed_image_schemas import TransformedImageModel, TransformedImageResponse, \
-    UrlTransformedImageResponse
+from src.schemas.transformed_image_schemas import TransformedImageModel, TransformedImageResponse
 from src.repository.transformed_images import get_all_transformed_images, delete_transformed_image_by_id, \
     create_transformed_picture, get_qrcode_transformed_image_by_id, get_transformed_image_by_id
+from src.services.response_cache import response_cache
+from src.services.transformed_image import qrcode_cache, QRCODE_MEDIA_TYPES
 
 router = APIRouter(prefix="/transformed_images", tags=["Transformed images"])
 
 
 @router.post("/{image_id}", response_model=TransformedImageResponse, status_code=status.HTTP_201_CREATED)
 async def create_new_transformed_image(body: TransformedImageModel, image_id: int = Path(ge=1),
-                                       db: Session = Depends(get_db)):
+                                       db: AsyncSession = Depends(get_db)):
     new_transformed_picture = await create_transformed_picture(body, image_id, db)
     return new_transformed_picture
 
 
 @router.get("/{image_id}", response_model=List[TransformedImageResponse])
-async def get_all_transformed_images_for_original_image_by_id(skip: int = 0, limit: int = 10,
+async def get_all_transformed_images_for_original_image_by_id(request: Request,
+                                                              after_id: int | None = Query(None, ge=0),
+                                                              limit: int = Query(10, ge=1, le=100),
                                                               image_id: int = Path(ge=1),
-                                                              db: Session = Depends(get_db)):
-    images = await get_all_transformed_images(skip, limit, image_id, db)
-    return images
+                                                              db: AsyncSession = Depends(get_db)):
+    return await response_cache.respond(request, [f"transformed:{image_id}"], List[TransformedImageResponse],
+                                        lambda: get_all_transformed_images(after_id, limit, image_id, db))
 
 
 @router.get("/transformed/{transformed_image_id}", response_model=TransformedImageResponse)
 async def get_transformed_pictures(transformed_image_id: int = Path(ge=1),
-                                   db: Session = Depends(get_db)):
+                                   db: AsyncSession = Depends(get_db)):
     transformed_image = await get_transformed_image_by_id(transformed_image_id, db)
     return transformed_image
 
 
-@router.get("/transformed/{transformed_image_id}/qrcode", response_model=UrlTransformedImageResponse)
-async def get_qrcode_for_transformed_pictures(transformed_image_id: int = Path(ge=1),
-                                              db: Session = Depends(get_db)):
-    transformed_image = await get_qrcode_transformed_image_by_id(transformed_image_id, db)
-    return ''
+@router.get("/transformed/{transformed_image_id}/qrcode", response_class=Response,
+            responses={200: {"content": {media_type: {} for media_type in QRCODE_MEDIA_TYPES.values()}}})
+async def get_qrcode_for_transformed_pictures(request: Request, transformed_image_id: int = Path(ge=1),
+                                              format: str = Query("png", regex="^(png|svg)$"),
+                                              box_size: int = Query(10, ge=1, le=40),
+                                              border: int = Query(4, ge=0, le=20),
+                                              db: AsyncSession = Depends(get_db)):
+    url_to_qrcode = await get_qrcode_transformed_image_by_id(transformed_image_id, db)
+    key = qrcode_cache.key(url_to_qrcode, format, box_size, border)
+    headers = {"ETag": f'"{key}"', "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    _, content = await qrcode_cache.get_or_render(url_to_qrcode, format, box_size, border)
+    return Response(content=content, media_type=QRCODE_MEDIA_TYPES[format], headers=headers)
 
 
 @router.delete("/transformed/{transformed_image_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_transformed_image(transformed_image_id: int = Path(ge=1),
-                                   db: Session = Depends(get_db)):
+                                   db: AsyncSession = Depends(get_db)):
     transformed_image = await delete_transformed_image_by_id(transformed_image_id, db)
     return None
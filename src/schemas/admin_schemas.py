@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+
+
+class PoolStatusResponse(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    wait_time_total: float
+    wait_time_max: float
+    wait_time_avg: float
+
+
+class CacheCountersResponse(BaseModel):
+    hits: int
+    misses: int
+    not_modified: int
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, conlist, constr
 from pydantic.schema import datetime
 
 
@@ -7,10 +9,14 @@ class ImageUpdateModel(BaseModel):
     description: str
 
 
+class ImageTagsModel(BaseModel):
+    tags: conlist(constr(strip_whitespace=True, min_length=1, max_length=25), min_items=1, max_items=50)
+
+
 class ImageDb(BaseModel):
     id: int
     url: str
-    description: str
+    description: Optional[str]
     user_id: int
     created_at: datetime
     updated_at: datetime
@@ -24,6 +30,11 @@ class ImageAddResponse(BaseModel):
     detail: str = "Image was successfully added"
 
 
+class ImagesAddResponse(BaseModel):
+    images: List[ImageDb]
+    detail: str = "Images were successfully added"
+
+
 
 
 
@@ -1,28 +1,23 @@
 from pydantic import BaseModel, Field
-from typing import Dict
 
 from src.schemas.user_schemas import UserResponse
 
 
-class ViewRatingModel(BaseModel):
-    one_star: bool
-    two_stars: bool
-    three_stars: bool
-    four_stars: bool
-    five_stars: bool
-
-
 class RatingModel(BaseModel):
-    rating: ViewRatingModel
-    user_id: int = Field(1, gt=0)
-    image_id: int = Field(1, gt=0)
+    rating: int = Field(5, ge=1, le=5)
 
 
 class RatingResponse(BaseModel):
     id: int = 1
-    rating: dict = {"one_star": False, "two_stars": False, "three_stars": False, "four_srats": False,
-                    "five_stars": False}
+    rating: int = 5
+    image_id: int = 1
     user: UserResponse
 
     class Config:
         orm_mode = True
+
+
+class AverageRatingResponse(BaseModel):
+    image_id: int = 1
+    average_rating: float = 0
+    rating_count: int = 0
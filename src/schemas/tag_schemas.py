@@ -6,6 +6,7 @@ class TagModel(BaseModel):
 
 
 class TagResponse(TagModel):
+    id: int
     name: str
 
     class Config:
@@ -1,4 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, conint, validator
+
+from src.conf.config import settings
+from src.services.image_engine import CROP_MODES, EFFECTS
 
 
 class TransformedImageResponse(BaseModel):
@@ -11,12 +14,28 @@ class TransformedImageResponse(BaseModel):
 
 
 class TransformedImageModel(BaseModel):
-    width: int = 500
-    height: int = 500
+    width: conint(ge=0, le=settings.image_max_dimension) = 500
+    height: conint(ge=0, le=settings.image_max_dimension) = 500
     crop: str = "fill"
-    # effect: str = "grayscale"
-    angle: int = 15
+    effect: str | None = None
+    angle: conint(ge=-360, le=360) = 15
+
+    @validator("crop")
+    def check_crop(cls, value):
+        value = value.strip().lower()
+        if value not in CROP_MODES:
+            raise ValueError(f"crop must be one of {', '.join(CROP_MODES)}")
+        return value
+
+    @validator("effect")
+    def check_effect(cls, value):
+        if value is None:
+            return value
+        value = value.strip().lower()
+        if value not in EFFECTS:
+            raise ValueError(f"effect must be one of {', '.join(EFFECTS)}")
+        return value
 
 
 class UrlTransformedImageResponse(BaseModel):
-    transform_image_url: str = ''
\ No newline at end of file
+    transform_image_url: str = ''
@@ -1,49 +1,76 @@
-import pickle
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
-import redis
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.conf.config import settings
 from src.conf.messages import AuthMessages
 from src.database.db import get_db
 from src.repository import users as repository_users
+from src.services import metrics
+from src.services.local_cache import ExpiringLRUCache
+from src.services.user_cache import user_cache
+
+
+password_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
     SECRET_KEY = settings.jwt_secret_key
     ALGORITHM = settings.jwt_algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    token_cache = ExpiringLRUCache(settings.token_cache_size)
+
+    async def _run_in_password_pool(self, func, *args):
+        loop = asyncio.get_running_loop()
+        metrics.PASSWORD_HASH_QUEUE.inc()
+        try:
+            return await loop.run_in_executor(password_executor, func, *args)
+        finally:
+            metrics.PASSWORD_HASH_QUEUE.dec()
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
         password as arguments. It then uses the pwd_context object to verify that the
-        plain-text password matches the hashed one.
+        plain-text password matches the hashed one. Bcrypt runs on the password thread pool.
 
         :param plain_password: Check if the password entered by the user matches with what is stored in the database
         :param hashed_password: Check the password that is being passed in against the hashed password stored
         in the database
         :return: True if the plain_password is correct, and false otherwise
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await self._run_in_password_pool(self.pwd_context.verify, plain_password, hashed_password)
+
+    async def verify_and_update_password(self, plain_password, hashed_password):
+        """
+        The verify_and_update_password function verifies the password like verify_password does and,
+        when the stored hash was made with other bcrypt settings than the configured ones, also
+        returns a new hash of the password made with the current settings.
+
+        :param plain_password: The password entered by the user
+        :param hashed_password: The hashed password stored in the database
+        :return: A tuple (valid, new_hash), new_hash is None when the stored hash is up to date
+        """
+        return await self._run_in_password_pool(self.pwd_context.verify_and_update, plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
-        The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
+        The hash is generated using the pwd_context object on the password thread pool.
 
         :param password: str: Specify the password that will be hashed
         :return: A string that is a hash of the password
         """
-        return self.pwd_context.hash(password)
+        return await self._run_in_password_pool(self.pwd_context.hash, password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -102,14 +129,32 @@ class Auth:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail=AuthMessages.could_not_validate_credentials)
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    def decode_access_token(self, token: str) -> dict:
+        """
+        The decode_access_token function verifies and decodes a token. The claims of verified tokens are kept
+        in a bounded cache keyed by the sha256 digest of the token until the token expires, so repeated calls
+        with the same token skip the signature check.
+
+        :param token: str: The encoded token
+        :return: The claims of the token
+        """
+        digest = hashlib.sha256(token.encode()).digest()
+        payload = self.token_cache.get(digest)
+        if payload is None:
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            if "exp" in payload:
+                self.token_cache.set(digest, payload, payload["exp"])
+        return payload
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
         protected endpoints. It takes a token as an argument and returns the user
         if it's valid, otherwise raises an HTTPException with status code 401.
+        FastAPI caches dependencies per request, so the RolesAccess checks and the route share one call.
 
         :param token: str: Get the token from the authorization header
-        :param db: Session: Pass the database session to the function
+        :param db: AsyncSession: Pass the database session to the function
         :return: A user object
         """
         credentials_exception = HTTPException(
@@ -119,7 +164,7 @@ class Auth:
         )
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_access_token(token)
             if payload['scope'] == 'access_token':
                 email = payload["sub"]
                 if email is None:
@@ -128,15 +173,12 @@ class Auth:
                 raise credentials_exception
         except JWTError as e:
             raise credentials_exception
-        user = self.r.get(f"user:{email}")
+        user = await user_cache.get(email)
         if user is None:
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            await user_cache.set(user)
         return user
 
     def create_email_token(self, data: dict):
@@ -1,31 +1,143 @@
+import json
+import logging
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-import logging
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import redis.asyncio as redis
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
+from redis.exceptions import RedisError
 
 from src.services.auth import auth_service
 from src.conf.config import settings
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="App Name",  # TODO Change name
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+# the templates are compiled on first use and kept by the environment, every message only renders them
+templates = Environment(loader=FileSystemLoader(Path(__file__).parent / 'templates'),
+                        autoescape=select_autoescape(["html"]))
+
+
+def build_message(job: dict) -> EmailMessage:
+    """
+    The build_message function renders the template of a queued mail job into an email message.
+
+    :param job: dict: The job with subject, recipient, template and template body
+    :return: An email message ready to be sent
+    """
+    message = EmailMessage()
+    message["From"] = formataddr((settings.mail_from_name, settings.mail_from))
+    message["To"] = job["recipient"]
+    message["Subject"] = job["subject"]
+    html = templates.get_template(job["template"]).render(**job["body"])
+    message.set_content(html, subtype="html")
+    return message
+
+
+class MailQueue:
+    """
+    The MailQueue is the durable outbox of the app. The API enqueues jobs, a mail worker reserves them
+    by moving them to its own processing list and acknowledges them once they are sent. Every worker
+    keeps a heartbeat key alive while it runs, the jobs in the processing list of a worker whose
+    heartbeat expired are moved back to the outbox, so jobs of a crashed worker are not lost and jobs
+    of a live worker are not sent twice. Failed jobs wait in a sorted set until their retry time.
+    """
+
+    OUTBOX = "mail:outbox"
+    PROCESSING = "mail:processing:"
+    HEARTBEAT = "mail:heartbeat:"
+    WORKERS = "mail:workers"
+    RETRY = "mail:retry"
+    DEAD = "mail:dead"
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+
+    async def enqueue(self, job: dict):
+        await self.client.lpush(self.OUTBOX, json.dumps(job))
+
+    async def register(self, worker_id: str, ttl: float):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.sadd(self.WORKERS, worker_id)
+            pipe.set(self.HEARTBEAT + worker_id, 1, px=int(ttl * 1000))
+            await pipe.execute()
+
+    async def heartbeat(self, worker_id: str, ttl: float):
+        await self.client.set(self.HEARTBEAT + worker_id, 1, px=int(ttl * 1000))
+
+    async def unregister(self, worker_id: str):
+        await self._requeue(worker_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.srem(self.WORKERS, worker_id)
+            pipe.delete(self.HEARTBEAT + worker_id)
+            await pipe.execute()
+
+    async def reserve(self, worker_id: str, batch_size: int, timeout: float) -> list:
+        processing = self.PROCESSING + worker_id
+        raw = await self.client.blmove(self.OUTBOX, processing, timeout, "RIGHT", "LEFT")
+        if raw is None:
+            return []
+        batch = [raw]
+        while len(batch) < batch_size:
+            raw = await self.client.lmove(self.OUTBOX, processing, "RIGHT", "LEFT")
+            if raw is None:
+                break
+            batch.append(raw)
+        return batch
+
+    async def ack(self, worker_id: str, raw):
+        await self.client.lrem(self.PROCESSING + worker_id, 1, raw)
+
+    async def retry(self, worker_id: str, raw, job: dict, delay: float):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.RETRY, {json.dumps(job): time.time() + delay})
+            pipe.lrem(self.PROCESSING + worker_id, 1, raw)
+            await pipe.execute()
+
+    async def bury(self, worker_id: str, raw, job: dict | None):
+        async with self.client.pipeline(transaction=True) as pipe:
+            # a job that is not valid JSON is kept as it was queued
+            pipe.lpush(self.DEAD, json.dumps(job) if job is not None else raw)
+            pipe.lrem(self.PROCESSING + worker_id, 1, raw)
+            await pipe.execute()
+
+    async def requeue_due(self):
+        for raw in await self.client.zrangebyscore(self.RETRY, 0, time.time()):
+            # only the worker that removes the job from the retry set puts it back
+            if await self.client.zrem(self.RETRY, raw):
+                await self.client.lpush(self.OUTBOX, raw)
+
+    async def _requeue(self, worker_id: str) -> int:
+        moved = 0
+        while await self.client.lmove(self.PROCESSING + worker_id, self.OUTBOX, "RIGHT", "RIGHT") is not None:
+            moved += 1
+        return moved
+
+    async def recover(self) -> int:
+        """
+        The recover function moves the jobs reserved by dead workers back to the outbox.
+        A worker is dead when its heartbeat key expired.
+
+        :return: The number of recovered jobs
+        """
+        recovered = 0
+        for worker_id in await self.client.smembers(self.WORKERS):
+            worker_id = worker_id.decode() if isinstance(worker_id, bytes) else worker_id
+            if await self.client.exists(self.HEARTBEAT + worker_id):
+                continue
+            # LMOVE moves every job once, even when two workers recover the same list at the same time
+            recovered += await self._requeue(worker_id)
+            await self.client.srem(self.WORKERS, worker_id)
+        return recovered
+
+
+mail_queue = MailQueue(redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0))
 
 
 async def send_email(email: EmailStr, username: str, host: str):
     """
-    The send_email function sends an email to the user with a link to confirm their email address.
+    The send_email function queues an email to the user with a link to confirm their email address.
+    The message is rendered and sent by the mail worker (src/services/email_worker.py).
     The function takes in three parameters:
     -email: EmailStr, the user's email address that they entered when signing up for an account.
     -username: str, the username of the user who is trying to sign up for an account. This will be used in
@@ -37,16 +149,14 @@ async def send_email(email: EmailStr, username: str, host: str):
     :param host: str: Create the link to the frontend
     :return: A coroutine object
     """
+    token_verification = auth_service.create_email_token({"sub": email})
     try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        logging.error(err)
+        await mail_queue.enqueue({
+            "subject": "Confirm your email",
+            "recipient": email,
+            "template": "email_template.html",
+            "body": {"host": host, "username": username, "token": token_verification},
+            "attempts": 0,
+        })
+    except RedisError as err:
+        logging.error("Could not queue the email to %s: %s", email, err)
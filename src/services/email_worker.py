@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+import aiosmtplib
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.email import MailQueue, mail_queue, build_message
+
+
+class MailWorker:
+    """
+    The MailWorker drains the mail queue in batches over one reused SMTP connection.
+    The connection is closed after it was idle for settings.mail_idle_timeout seconds
+    and reopened on the next batch. Jobs that failed on SMTP or the network are retried with
+    exponential backoff, jobs that can never be sent, e.g. with a broken payload or template,
+    go to the dead list at once. While Redis is unavailable the worker waits and retries it with a
+    backoff of up to redis_retry seconds.
+    The heartbeat of the worker expires ttl seconds after its last sign of life, ttl has to be
+    longer than sending one email. Every ttl seconds the worker recovers the jobs of dead workers.
+    """
+
+    def __init__(self, queue: MailQueue, batch_size: int, max_attempts: int, retry_delay: float,
+                 idle_timeout: float, ttl: float, redis_retry: float, worker_id: str | None = None):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self.redis_retry = redis_retry
+        self._smtp = None
+        self._last_used = 0.0
+        self._recovered_at = 0.0
+
+    async def _connection(self) -> aiosmtplib.SMTP:
+        if self._smtp is None or not self._smtp.is_connected:
+            self._smtp = aiosmtplib.SMTP(
+                hostname=settings.mail_server,
+                port=settings.mail_port,
+                username=settings.mail_username if settings.mail_use_credentials else None,
+                password=settings.mail_password if settings.mail_use_credentials else None,
+                use_tls=settings.mail_ssl_tls,
+                start_tls=settings.mail_starttls,
+                validate_certs=settings.mail_validate_certs,
+            )
+            await self._smtp.connect()
+        return self._smtp
+
+    async def close(self):
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.quit()
+            except aiosmtplib.SMTPException:
+                self._smtp.close()
+        self._smtp = None
+
+    async def _handle(self, raw):
+        job = None
+        try:
+            job = json.loads(raw)
+            message = build_message(job)
+        except Exception as err:  # noqa
+            # a broken job fails the same way on every attempt
+            logging.error("Dropping broken email job: %r", err)
+            await self.queue.bury(self.worker_id, raw, job if isinstance(job, dict) else None)
+            return
+        try:
+            smtp = await self._connection()
+            await smtp.send_message(message)
+        except (aiosmtplib.SMTPException, OSError) as err:
+            await self.close()
+            job["attempts"] = job.get("attempts", 0) + 1
+            if job["attempts"] >= self.max_attempts:
+                logging.error("Giving up on email to %s: %s", job["recipient"], err)
+                await self.queue.bury(self.worker_id, raw, job)
+            else:
+                logging.warning("Email to %s failed, attempt %s: %s", job["recipient"], job["attempts"], err)
+                await self.queue.retry(self.worker_id, raw, job, self.retry_delay * 2 ** (job["attempts"] - 1))
+            return
+        except Exception as err:  # noqa
+            logging.error("Dropping email to %s: %r", job.get("recipient"), err)
+            await self.queue.bury(self.worker_id, raw, job)
+            return
+        self._last_used = time.monotonic()
+        await self.queue.ack(self.worker_id, raw)
+
+    async def run_once(self, timeout: float = 1.0) -> int:
+        """
+        The run_once function sends one batch of queued emails.
+
+        :param timeout: float: How long to wait for the first job of the batch
+        :return: The number of handled jobs
+        """
+        await self.queue.heartbeat(self.worker_id, self.ttl)
+        if time.monotonic() - self._recovered_at > self.ttl:
+            await self.recover()
+        await self.queue.requeue_due()
+        batch = await self.queue.reserve(self.worker_id, self.batch_size, timeout)
+        if not batch:
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                await self.close()
+            return 0
+        for raw in batch:
+            await self.queue.heartbeat(self.worker_id, self.ttl)
+            await self._handle(raw)
+        return len(batch)
+
+    async def recover(self):
+        self._recovered_at = time.monotonic()
+        recovered = await self.queue.recover()
+        if recovered:
+            logging.warning("Recovered %s emails of dead mail workers", recovered)
+
+    async def run(self):
+        backoff = 1.0
+        try:
+            while True:
+                try:
+                    await self.queue.register(self.worker_id, self.ttl)
+                    while True:
+                        await self.run_once()
+                        backoff = 1.0
+                except RedisError as err:
+                    logging.warning("Mail queue is unavailable, retrying in %.0fs: %s", backoff, err)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.redis_retry)
+        finally:
+            await self.close()
+            try:
+                # the jobs this worker reserved and did not send go back to the outbox
+                await self.queue.unregister(self.worker_id)
+            except RedisError as err:
+                # the heartbeat expires and another worker recovers the jobs
+                logging.warning("Could not unregister mail worker %s: %s", self.worker_id, err)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    worker = MailWorker(mail_queue,
+                        batch_size=settings.mail_batch_size,
+                        max_attempts=settings.mail_max_attempts,
+                        retry_delay=settings.mail_retry_delay,
+                        idle_timeout=settings.mail_idle_timeout,
+                        ttl=settings.mail_worker_ttl,
+                        redis_retry=settings.mail_redis_retry)
+    asyncio.run(worker.run())
+
+
+if __name__ == '__main__':
+    main()
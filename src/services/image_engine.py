@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
+
+from src.conf.config import settings
+
+EFFECTS = {
+    "grayscale": lambda img: ImageOps.grayscale(img),
+    "blur": lambda img: img.filter(ImageFilter.GaussianBlur(4)),
+    "sharpen": lambda img: img.filter(ImageFilter.SHARPEN),
+    "negate": lambda img: ImageOps.invert(img.convert("RGB")),
+}
+CROP_MODES = ("fill", "fit", "limit", "crop", "scale")
+INT_PARAMS = ("width", "height", "angle")
+PARAMS = INT_PARAMS + ("crop", "effect")
+
+
+def parse_transformation_key(key: str) -> dict:
+    """
+    The parse_transformation_key function turns a canonical transformation key back into parameters.
+    The key comes from the url of the files route, which needs no authentication, so the sizes are capped
+    at settings.image_max_dimension before anything is rendered.
+
+    :param key: str: The key, e.g. angle=15,crop=fill,width=300
+    :return: A dictionary of the parameters
+    """
+    params = {}
+    for part in filter(None, key.split(",")):
+        name, _, value = part.partition("=")
+        if name not in PARAMS or not value:
+            raise ValueError(f"Unknown transformation parameter: {part}")
+        try:
+            params[name] = int(value) if name in INT_PARAMS else value
+        except ValueError:
+            raise ValueError(f"Invalid transformation parameter: {part}")
+    for name in ("width", "height"):
+        if name in params and not 1 <= params[name] <= settings.image_max_dimension:
+            raise ValueError(f"The {name} must be between 1 and {settings.image_max_dimension}")
+    if "angle" in params and not 0 <= params["angle"] < 360:
+        raise ValueError("The angle must be between 0 and 359")
+    if "crop" in params and params["crop"] not in CROP_MODES:
+        raise ValueError(f"Unknown crop mode: {params['crop']}")
+    if "effect" in params and params["effect"] not in EFFECTS:
+        raise ValueError(f"Unknown effect: {params['effect']}")
+    return params
+
+
+def _resize(img: Image.Image, width: int | None, height: int | None, crop: str | None) -> Image.Image:
+    if not width and not height:
+        return img
+    if not width:
+        width = max(round(img.width * height / img.height), 1)
+    if not height:
+        height = max(round(img.height * width / img.width), 1)
+    if crop == "fill":
+        return ImageOps.fit(img, (width, height))
+    if crop in ("fit", "limit"):
+        img = img.copy()
+        img.thumbnail((width, height))
+        return img
+    if crop == "crop":
+        left, top = max((img.width - width) // 2, 0), max((img.height - height) // 2, 0)
+        return img.crop((left, top, left + min(width, img.width), top + min(height, img.height)))
+    return img.resize((width, height))
+
+
+def render(source: str, target: str, params: dict) -> str:
+    """
+    The render function applies the transformation to the source image and writes the result to target.
+    It runs in the worker processes of the engine.
+
+    :param source: str: The path of the original image
+    :param target: str: The path of the derivative
+    :param params: dict: The parameters of the transformation
+    :return: The path of the derivative
+    """
+    try:
+        img = Image.open(source)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as err:
+        # a ValueError is pickled back to the app like any other and answered with 422
+        raise ValueError(f"The file can not be transformed: {err}")
+    with img:
+        img = ImageOps.exif_transpose(img)
+        img = _resize(img, params.get("width"), params.get("height"), params.get("crop"))
+        if params.get("angle"):
+            # Cloudinary rotates clockwise, Pillow counterclockwise
+            img = img.rotate(-params["angle"], expand=True)
+        if params.get("effect"):
+            img = EFFECTS[params["effect"]](img)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.convert("RGB").save(tmp, format="JPEG", quality=85)
+    os.replace(tmp, target)
+    return target
+
+
+class ImageEngine:
+    """
+    The ImageEngine renders the transformations of local images in a process pool. The derivatives are
+    content addressed: they are stored under a name derived from the sha256 digest of the source bytes
+    and the transformation key, so a derivative is never rendered twice, not even for a copy of the
+    source under another name, and concurrent requests for the same derivative share one render.
+    """
+
+    def __init__(self, directory: str, workers: int | None):
+        self.directory = Path(directory)
+        self.workers = workers or os.cpu_count()
+        self._pool = None
+        self._in_flight = {}
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _content_digest(source: str, mtime_ns: int, size: int) -> str:
+        # the stat of the file is only part of the cache key, a replaced file is hashed again
+        digest = hashlib.sha256()
+        with open(source, "rb") as file:
+            while chunk := file.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    async def derivative_path(self, source: Path, key: str) -> Path:
+        stat = source.stat()
+        content = await asyncio.to_thread(self._content_digest, str(source), stat.st_mtime_ns, stat.st_size)
+        digest = hashlib.sha256(f"{content}:{key}".encode()).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.jpg"
+
+    async def get(self, source: Path, key: str) -> Path:
+        """
+        The get function returns the path of the derivative of the source image, rendering it when needed.
+
+        :param source: Path: The path of the original image
+        :param key: str: The canonical transformation key
+        :return: The path of the derivative
+        """
+        params = parse_transformation_key(key)
+        target = await self.derivative_path(source, key)
+        if target.is_file():
+            return target
+        future = self._in_flight.get(target)
+        if future is None:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            loop = asyncio.get_running_loop()
+            future = asyncio.ensure_future(loop.run_in_executor(self.pool, render, str(source), str(target), params))
+            self._in_flight[target] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(target, None))
+        await asyncio.shield(future)
+        return target
+
+
+image_engine = ImageEngine(os.path.join(settings.storage_local_path, ".derived"), settings.image_engine_workers)
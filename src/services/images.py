@@ -1,20 +1,45 @@
-from src.database.models import Image
+from sqlalchemy import select
 
+from src.database.db import get_insert
+from src.database.models import Image, PublicNameCounter
+from src.services.storage import storage
 
-async def images_service_change_name(public_name, db):
-    correct_public_name = public_name
-    suffix = 1
 
-    while db.query(Image).filter(Image.public_name == correct_public_name).first():
-        suffix += 1
-        correct_public_name = f"{public_name}_{suffix}"
+async def images_service_change_name(public_name, db):
+    """
+    The images_service_change_name function allocates the next free public name for a base name
+    in a single round trip: an upsert increments the per-base-name counter and returns it.
+    The first image keeps the base name, the next ones get the _2, _3, ... suffixes.
 
-    return correct_public_name
+    :param public_name: The base name of the uploaded file
+    :param db: AsyncSession: The database session
+    :return: The allocated public name
+    """
+    counters = PublicNameCounter.__table__
+    insert = get_insert(db)
+    stmt = insert(counters).values(base_name=public_name, counter=1)
+    stmt = stmt.on_conflict_do_update(index_elements=[counters.c.base_name],
+                                      set_={"counter": counters.c.counter + 1}).returning(counters.c.counter)
+    suffix = (await db.execute(stmt)).scalar_one()
+    return public_name if suffix == 1 else f"{public_name}_{suffix}"
 
 
 async def images_service_id_exists(id, db):
-    if db.query(Image).filter(Image.id == id).first():
+    if (await db.execute(select(Image.id).filter(Image.id == id))).first():
         return True
     else:
         return False
 
+
+async def images_service_upload(file, file_name: str) -> str:
+    """
+    The images_service_upload function stores a file in the configured storage backend.
+    The blocking upload runs on the storage thread pool, so it does not stall the event loop.
+
+    :param file: A binary file object
+    :param file_name: str: The name of the file inside the PhotoShare folder
+    :return: The url of the uploaded image
+    """
+    key = f'PhotoShare/{file_name}'
+    version = await storage.put(file, key)
+    return storage.url(key, width=250, height=250, crop='fill', version=version)
@@ -0,0 +1,50 @@
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+
+# Every uvicorn worker records its own samples. With PROMETHEUS_MULTIPROC_DIR set, prometheus_client
+# keeps them in memory mapped files of that directory and /metrics merges the files of all workers,
+# so any worker can answer the scrape. The directory has to be emptied before the workers start.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0)
+
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "Latency of HTTP requests",
+                                  ["method", "route", "status"])
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being handled", ["method"],
+                                  multiprocess_mode="livesum")
+
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections in use",
+                            multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Database connections over the pool size",
+                         multiprocess_mode="livesum")
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Time waited for a database connection", buckets=FAST_BUCKETS)
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts", "Checkouts that gave up waiting for a database connection")
+
+REDIS_DURATION = Histogram("redis_command_duration_seconds", "Round trips to Redis", ["client", "command"],
+                           buckets=FAST_BUCKETS)
+CACHE_REQUESTS = Counter("cache_requests", "Lookups in the caches", ["cache", "result"])
+RATE_LIMIT_CHECKS = Counter("rate_limit_checks", "Requests checked by the rate limiter", ["limit", "result"])
+STORAGE_UPLOAD_DURATION = Histogram("storage_upload_duration_seconds", "Uploads to the image storage",
+                                    ["backend"], buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+PASSWORD_HASH_QUEUE = Gauge("password_hash_queue_depth", "Password hashes queued or running on the bcrypt pool",
+                            multiprocess_mode="livesum")
+
+
+def render_metrics() -> bytes:
+    """
+    The render_metrics function renders the metrics in the Prometheus text format, merged over all
+    worker processes in multiprocess mode.
+
+    :return: The metrics
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import redis.asyncio as redis
+from fastapi import Depends, HTTPException, status
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.conf.messages import RateLimitMessages
+from src.database.models import User, Role
+from src.services import metrics
+from src.services.auth import auth_service
+from src.services.local_cache import ExpiringLRUCache
+
+# Adds the requests a process allowed since its last sync to the sliding window of the key and returns
+# the requests in the window and the milliseconds until the window has room again (0 when it has room).
+# The window is a sorted set of request timestamps taken from the Redis clock, so the clocks of the
+# app processes do not matter.
+SLIDING_WINDOW = """
+local key = KEYS[1]
+local count = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+for i = 1, count do
+    redis.call('ZADD', key, now, ARGV[4] .. ':' .. i)
+end
+local used = redis.call('ZCARD', key)
+if used > 0 then
+    redis.call('PEXPIRE', key, window)
+end
+if used < limit then
+    return {used, 0}
+end
+local oldest = redis.call('ZRANGE', key, used - limit, used - limit, 'WITHSCORES')
+return {used, math.max(tonumber(oldest[2]) + window - now, 1)}
+"""
+
+
+@dataclass
+class Bucket:
+    """
+    The Bucket is the local state of one rate limited key: a token bucket that holds up to times tokens
+    and refills them over seconds, the requests not yet synced to Redis and the time until which
+    Redis reported the window as full.
+    """
+    times: int
+    seconds: float
+    tokens: float
+    updated: float
+    pending: int = 0
+    synced_at: float = -math.inf
+    blocked_until: float = 0.0
+    syncing: bool = False
+
+    def refill(self, now: float):
+        self.tokens = min(self.times, self.tokens + (now - self.updated) * self.times / self.seconds)
+        self.updated = now
+
+
+class RateLimiter:
+    """
+    The RateLimiter decides every check in process with a token bucket per key and syncs the buckets with
+    a sliding window in Redis in the background, at most once per sync_interval and key. A sync adds the
+    requests the process allowed to the shared window, a full window blocks the key in every process until
+    the window has room again. Between two syncs a process can allow at most one bucket of requests that
+    other processes do not know of yet.
+
+    While Redis is unavailable, the buckets keep limiting every process on its own and Redis is retried
+    after redis_retry seconds, so a Redis outage neither fails requests nor the startup.
+    """
+
+    KEY_PREFIX = "rate:"
+
+    def __init__(self, client: redis.Redis, limits: Dict[str, Dict[str, Tuple[int, float] | None]],
+                 sync_interval: float, redis_retry: float, local_size: int):
+        self.client = client
+        self.limits = limits
+        self.sync_interval = sync_interval
+        self.redis_retry = redis_retry
+        self._script = client.register_script(SLIDING_WINDOW)
+        self._buckets = ExpiringLRUCache(local_size)
+        self._tasks = set()
+        self._redis_down_until = 0.0
+
+    def limit(self, name: str, role: Role | None) -> Tuple[int, float] | None:
+        """
+        The limit function returns the limit of a route for a role.
+
+        :param name: str: The name of the limit in settings.rate_limits
+        :param role: Role | None: The role of the user
+        :return: A (requests, seconds) tuple or None when the role is not limited
+        """
+        limits = self.limits[name]
+        return limits.get(role.value if role else "default", limits.get("default"))
+
+    def check(self, key: str, times: int, seconds: float) -> float:
+        """
+        The check function counts a request of the key against the limit of times requests per seconds.
+        It never waits for Redis.
+
+        :param key: str: The limited key, e.g. the limit name and the user id
+        :param times: int: The number of requests allowed in the window
+        :param seconds: float: The length of the window
+        :return: 0 when the request is allowed, otherwise the seconds after which to retry
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None or (bucket.times, bucket.seconds) != (times, seconds):
+            bucket = Bucket(times, seconds, tokens=times, updated=now)
+        # an idle bucket is full again after seconds, dropping it then loses nothing
+        self._buckets.set(key, bucket, time.time() + seconds + self.sync_interval)
+
+        bucket.refill(now)
+        if bucket.blocked_until > now:
+            retry_after = bucket.blocked_until - now
+        elif bucket.tokens < 1:
+            retry_after = (1 - bucket.tokens) * seconds / times
+        else:
+            retry_after = 0.0
+            bucket.tokens -= 1
+            bucket.pending += 1
+
+        if now < self._redis_down_until:
+            bucket.pending = 0
+        elif not bucket.syncing and now - bucket.synced_at >= self.sync_interval:
+            bucket.syncing = True
+            bucket.synced_at = now
+            task = asyncio.create_task(self._sync(key, bucket))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return retry_after
+
+    async def _sync(self, key: str, bucket: Bucket):
+        count, bucket.pending = bucket.pending, 0
+        try:
+            with metrics.REDIS_DURATION.labels("rate_limiter", "evalsha").time():
+                used, retry_ms = await self._script(keys=[self.KEY_PREFIX + key],
+                                                    args=[count, bucket.times, math.ceil(bucket.seconds * 1000),
+                                                          uuid.uuid4().hex])
+        except RedisError as err:
+            logging.warning("Rate limiter is unavailable, limiting locally: %s", err)
+            self._redis_down_until = time.monotonic() + self.redis_retry
+            return
+        finally:
+            bucket.syncing = False
+        now = time.monotonic()
+        bucket.refill(now)
+        # the requests of the other processes use up the tokens of this one
+        bucket.tokens = min(bucket.tokens, max(bucket.times - used - bucket.pending, 0))
+        if retry_ms:
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_ms / 1000)
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        # redis-py 5 renamed close to aclose
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+
+class RateLimit:
+    """
+    The RateLimit dependency limits the requests of the current user to a route with the limit of
+    settings.rate_limits[name] for the role of the user. A rejected request gets 429 with Retry-After.
+    """
+
+    def __init__(self, name: str):
+        if name not in settings.rate_limits:
+            raise ValueError(f"No rate limit is configured for {name}")
+        self.name = name
+
+    async def __call__(self, current_user: User = Depends(auth_service.get_current_user)):
+        limit = rate_limiter.limit(self.name, current_user.role)
+        if limit is None:
+            return
+        retry_after = rate_limiter.check(f"{self.name}:{current_user.id}", *limit)
+        metrics.RATE_LIMIT_CHECKS.labels(self.name, "rejected" if retry_after else "allowed").inc()
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail=RateLimitMessages.too_many_requests,
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+rate_limiter = RateLimiter(redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0),
+                           limits=settings.rate_limits,
+                           sync_interval=settings.rate_limit_sync_interval,
+                           redis_retry=settings.rate_limit_redis_retry,
+                           local_size=settings.rate_limit_local_size)
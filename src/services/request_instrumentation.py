@@ -0,0 +1,102 @@
+import json
+import logging
+import time
+from contextlib import nullcontext
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.database.query_stats import count_queries, QueryBudgetExceeded
+from src.services import metrics
+
+slow_query_log = logging.getLogger("slow_queries")
+
+
+class RequestInstrumentation:
+    """
+    The RequestInstrumentation is a pure ASGI middleware that does all per-request instrumentation of the app
+    in one layer, by wrapping send instead of the response:
+
+    - query_budget: every GET request that executes more SQL statements than the budget fails with 500.
+      It is meant for test and CI runs, where it catches listings that load relationships row by row.
+    - instrument_queries: the SQL statements slower than slow_query_ms are written to the slow query log.
+    - server_timing: the number of SQL statements, the time spent in the database and the duration of the
+      slowest statement are sent in the Server-Timing header. It exposes the database timing to every
+      client, so it is off by default.
+    - metrics: the requests in progress and the request duration by route and status go to Prometheus.
+    """
+
+    def __init__(self, app: ASGIApp, query_budget: int | None = None, instrument_queries: bool = False,
+                 server_timing: bool = False, slow_query_ms: float | None = None, metrics_enabled: bool = False):
+        self.app = app
+        self.query_budget = query_budget
+        self.instrument_queries = instrument_queries
+        self.server_timing = server_timing
+        self.slow_threshold = slow_query_ms / 1000 if instrument_queries and slow_query_ms is not None else None
+        self.metrics_enabled = metrics_enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        budget = self.query_budget if method == "GET" else None
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        replaced = False
+        started = time.perf_counter()
+        if self.metrics_enabled:
+            metrics.HTTP_REQUESTS_IN_PROGRESS.labels(method).inc()
+
+        async def instrumented_send(message: Message):
+            nonlocal status_code, replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                # every statement of the endpoint ran before its response starts
+                if budget is not None:
+                    try:
+                        counter.check_budget(budget)
+                    except QueryBudgetExceeded as err:
+                        logging.error("%s %s: %s", method, scope["path"], err)
+                        replaced = True
+                        response = JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                                content={"detail": "Query budget exceeded"})
+                        await response(scope, receive, send)
+                        return
+                status_code = message["status"]
+                if self.server_timing:
+                    total = time.perf_counter() - started
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", f'db;dur={counter.duration * 1000:.2f};desc="{counter.count} queries", '
+                                         f'db-slowest;dur={counter.slowest_duration * 1000:.2f}, '
+                                         f'total;dur={total * 1000:.2f}')
+            await send(message)
+
+        counting = self.instrument_queries or self.server_timing or budget is not None
+        try:
+            with count_queries(record_statements=budget is not None, slow_threshold=self.slow_threshold) \
+                    if counting else nullcontext() as counter:
+                await self.app(scope, receive, instrumented_send)
+        finally:
+            if self.metrics_enabled:
+                metrics.HTTP_REQUESTS_IN_PROGRESS.labels(method).dec()
+                # the route template, not the path, keeps the number of label values bounded
+                route = scope.get("route")
+                metrics.HTTP_REQUEST_DURATION.labels(method, route.path if route else "unmatched",
+                                                     str(status_code)).observe(time.perf_counter() - started)
+
+        if counting and counter.slow_statements:
+            route = scope.get("route")
+            for statement, duration in counter.slow_statements:
+                slow_query_log.warning(json.dumps({
+                    "route": route.name if route else None,
+                    "path": route.path if route else scope["path"],
+                    "method": method,
+                    "duration_ms": round(duration * 1000, 2),
+                    "request_queries": counter.count,
+                    "request_db_ms": round(counter.duration * 1000, 2),
+                    "statement": " ".join(statement.split())[:2000],
+                }))
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, List
+from urllib.parse import urlencode
+
+import redis.asyncio as redis
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services import metrics
+from src.services.local_cache import ExpiringLRUCache
+
+
+class ResponseCache:
+    """
+    The ResponseCache stores serialized responses of read endpoints in Redis, or in process memory
+    while Redis is unavailable. Every response depends on one or more namespaces (e.g. "tags",
+    "comments:12") that have a version counter. The versions are part of the cache key, so
+    invalidating a namespace only increments its counter and the old entries expire on their own.
+    A response computed while a write commits is stored under the old version and never served.
+
+    While Redis is unavailable the cache works in process memory and Redis is retried after
+    redis_retry seconds. A namespace whose invalidation could not reach Redis is not cached at all
+    until its counter in Redis was incremented, otherwise the entries stored in Redis before the
+    outage would be served again once Redis is back.
+    """
+
+    VERSION_PREFIX = "cache:version:"
+    ENTRY_PREFIX = "cache:entry:"
+
+    def __init__(self, client: redis.Redis, ttl: int, local_size: int, redis_retry: float):
+        self.client = client
+        self.ttl = ttl
+        self.redis_retry = redis_retry
+        self._local = ExpiringLRUCache(local_size)
+        self._local_versions = defaultdict(int)
+        self._unsynced = {}  # namespace: local version of the invalidations that have not reached Redis yet
+        self._redis_down_until = 0.0
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "not_modified": 0})
+
+    def stats(self) -> dict:
+        return {kind: dict(counters) for kind, counters in self._stats.items()}
+
+    @staticmethod
+    def _variant(request: Request) -> str:
+        return request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+
+    def _redis_down(self, err: RedisError):
+        logging.warning("Response cache is unavailable, caching locally: %s", err)
+        self._redis_down_until = time.monotonic() + self.redis_retry
+
+    async def _sync_invalidations(self) -> bool:
+        unsynced = dict(self._unsynced)
+        if not unsynced:
+            return True
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for namespace in unsynced:
+                    pipe.incr(self.VERSION_PREFIX + namespace)
+                await pipe.execute()
+        except RedisError as err:
+            self._redis_down(err)
+            return False
+        for namespace, version in unsynced.items():
+            # a namespace invalidated again while the pipeline ran stays unsynced
+            if self._unsynced.get(namespace) == version:
+                del self._unsynced[namespace]
+        return True
+
+    async def _versions(self, namespaces: List[str]) -> List[int] | None:
+        if time.monotonic() < self._redis_down_until or not await self._sync_invalidations():
+            return None
+        try:
+            versions = await self.client.mget([self.VERSION_PREFIX + namespace for namespace in namespaces])
+        except RedisError as err:
+            self._redis_down(err)
+            return None
+        return [int(version or 0) for version in versions]
+
+    def _entry_key(self, variant: str, namespaces: List[str], versions: List[int]) -> str:
+        versioned = ",".join(f"{namespace}={version}" for namespace, version in zip(namespaces, versions))
+        return self.ENTRY_PREFIX + hashlib.sha256(f"{variant}|{versioned}".encode()).hexdigest()
+
+    async def _get(self, key: str, remote: bool) -> bytes | None:
+        if not remote:
+            return self._local.get(key)
+        try:
+            return await self.client.get(key)
+        except RedisError as err:
+            self._redis_down(err)
+            return None
+
+    async def _set(self, key: str, entry: bytes, remote: bool):
+        if not remote:
+            self._local.set(key, entry, time.time() + self.ttl)
+            return
+        try:
+            await self.client.setex(key, self.ttl, entry)
+        except RedisError as err:
+            self._redis_down(err)
+
+    async def respond(self, request: Request, namespaces: List[str], model: Any,
+                      load: Callable[[], Awaitable[Any]]) -> Response:
+        """
+        The respond function returns the cached response of the request, or loads, serializes and caches it
+        on a miss. The response carries a strong ETag (a digest of the body), a matching If-None-Match
+        header is answered with 304 Not Modified.
+
+        :param request: Request: The request, its path and query string identify the response
+        :param namespaces: List[str]: The namespaces the response depends on
+        :param model: Any: The response model the loaded data is serialized with
+        :param load: Callable[[], Awaitable[Any]]: Loads the data from the database on a miss
+        :return: The response
+        """
+        kind = namespaces[0].split(":")[0]
+        counters = self._stats[kind]
+        versions = await self._versions(namespaces)
+        remote = versions is not None
+        if not remote:
+            versions = [self._local_versions[namespace] for namespace in namespaces]
+        key = self._entry_key(self._variant(request), namespaces, versions)
+        cached = not any(namespace in self._unsynced for namespace in namespaces)
+
+        entry = await self._get(key, remote) if cached else None
+        if entry is not None:
+            counters["hits"] += 1
+            metrics.CACHE_REQUESTS.labels(f"response_{kind}", "hit").inc()
+            etag, _, body = entry.partition(b"\n")
+            etag = etag.decode()
+        else:
+            counters["misses"] += 1
+            metrics.CACHE_REQUESTS.labels(f"response_{kind}", "miss").inc()
+            data = await load()
+            body = json.dumps(jsonable_encoder(parse_obj_as(model, data)), separators=(",", ":")).encode()
+            etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            if cached:
+                await self._set(key, etag.encode() + b"\n" + body, remote)
+
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            counters["not_modified"] += 1
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, *namespaces: str):
+        """
+        The invalidate function drops the cached responses of the namespaces. The repository functions
+        call it after they commit a write to the data of the namespaces.
+
+        :param namespaces: str: The namespaces to invalidate
+        :return: Nothing
+        """
+        for namespace in namespaces:
+            self._local_versions[namespace] += 1
+            self._unsynced[namespace] = self._local_versions[namespace]
+        if time.monotonic() >= self._redis_down_until:
+            await self._sync_invalidations()
+
+
+response_cache = ResponseCache(redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0),
+                               ttl=settings.response_cache_ttl,
+                               local_size=settings.response_cache_local_size,
+                               redis_retry=settings.response_cache_redis_retry)
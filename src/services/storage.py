@@ -0,0 +1,162 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import urllib.request
+from urllib.parse import quote
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cloudinary
+import cloudinary.uploader
+
+from src.conf.config import settings
+from src.services import metrics
+from src.services.transformed_image import transformation_key
+
+CHUNK_SIZE = 1024 * 1024
+MAGIC_NUMBERS = {b"\xff\xd8\xff": "image/jpeg", b"\x89PNG": "image/png", b"GIF8": "image/gif", b"RIFF": "image/webp",
+                 b"BM": "image/bmp"}
+
+storage_executor = ThreadPoolExecutor(max_workers=settings.upload_workers, thread_name_prefix="storage")
+
+
+class Storage(ABC):
+    """
+    The Storage is the interface of the places where the image files live.
+    The blocking work of every backend runs on the storage thread pool.
+    """
+
+    name: str
+
+    @abstractmethod
+    def _put(self, file, key: str) -> str:
+        ...
+
+    @abstractmethod
+    def _get(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def _delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def url(self, key: str, **options) -> str:
+        """
+        The url function builds the public url of a stored file.
+
+        :param key: str: The key of the file
+        :param options: Transformation options of the backend (width, height, crop, ...)
+        :return: The url of the file
+        """
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(storage_executor, func, *args)
+
+    async def put(self, file, key: str) -> str:
+        """
+        The put function stores a binary file object under the key.
+
+        :param file: A binary file object
+        :param key: str: The key of the file
+        :return: The version of the stored file
+        """
+        with metrics.STORAGE_UPLOAD_DURATION.labels(self.name).time():
+            return await self._run(self._put, file, key)
+
+    async def get(self, key: str) -> bytes:
+        return await self._run(self._get, key)
+
+    async def delete(self, key: str) -> None:
+        await self._run(self._delete, key)
+
+
+class CloudinaryStorage(Storage):
+    name = "cloudinary"
+
+    def _put(self, file, key: str) -> str:
+        r = cloudinary.uploader.upload(file, public_id=key, overwrite=True)
+        return str(r.get('version'))
+
+    def _get(self, key: str) -> bytes:
+        with urllib.request.urlopen(self.url(key)) as response:
+            return response.read()
+
+    def _delete(self, key: str) -> None:
+        cloudinary.uploader.destroy(key)
+
+    def url(self, key: str, **options) -> str:
+        return cloudinary.CloudinaryImage(key).build_url(**options)
+
+
+class LocalStorage(Storage):
+    """
+    The LocalStorage keeps the files on the local disk, so the app runs and can be load tested without
+    the network. Uploads are streamed to disk in chunks, the files are served by the files route.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip("/")
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def _put(self, file, key: str) -> str:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, so readers never see a half written file
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+            shutil.copyfileobj(file, tmp, CHUNK_SIZE)
+        os.replace(tmp.name, path)
+        return str(int(path.stat().st_mtime))
+
+    def _get(self, key: str) -> bytes:
+        return self.path(key).read_bytes()
+
+    def media_type(self, key: str) -> str:
+        with open(self.path(key), "rb") as file:
+            head = file.read(8)
+        for magic, media_type in MAGIC_NUMBERS.items():
+            if head.startswith(magic):
+                return media_type
+        return "application/octet-stream"
+
+    def _delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def url(self, key: str, **options) -> str:
+        # the transformations are rendered by the local image engine when the url is requested
+        steps = list(options.get("transformation") or [])
+        step = {name: options[name] for name in ("width", "height", "crop", "angle", "effect") if options.get(name)}
+        if step:
+            steps.append(step)
+        if not steps:
+            return f"{self.base_url}/{key}"
+        return f"{self.base_url}/{key}?transformation={quote(transformation_key(steps))}"
+
+
+def init_cloudinary():
+    cloudinary.config(
+        cloud_name=settings.cloudinary_name,
+        api_key=settings.cloudinary_api_key,
+        api_secret=settings.cloudinary_api_secret,
+        secure=True
+    )
+
+
+def create_storage() -> Storage:
+    if settings.storage_backend == "local":
+        return LocalStorage(settings.storage_local_path, settings.storage_base_url)
+    return CloudinaryStorage()
+
+
+storage = create_storage()
@@ -0,0 +1,84 @@
+from bisect import bisect_left, insort
+from typing import Iterable, List, Tuple
+
+
+class TagIndex:
+    """
+    The TagIndex answers tag autocomplete from memory. It keeps (lower case name, id, name) tuples
+    in a sorted list, so the tags with a prefix are a contiguous run found with one bisect.
+    The repository keeps it in sync on tag writes, a periodic rebuild picks up the writes
+    made by the other worker processes. The writes made between start_rebuild and rebuild are
+    replayed on the new entries, the snapshot of the rebuild may have been read before them.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._journal: List[Tuple[bool, Tuple[str, int, str]]] | None = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start_rebuild(self):
+        self._journal = []
+
+    def abort_rebuild(self):
+        self._journal = None
+
+    def rebuild(self, tags: Iterable[Tuple[int, str]]):
+        entries = sorted((name.lower(), tag_id, name) for tag_id, name in tags)
+        journal, self._journal = self._journal or [], None
+        self._entries = entries
+        for added, entry in journal:
+            if added:
+                self._add(entry)
+            else:
+                self._remove(entry)
+
+    def _add(self, entry: Tuple[str, int, str]):
+        position = bisect_left(self._entries, entry)
+        if position == len(self._entries) or self._entries[position] != entry:
+            insort(self._entries, entry)
+
+    def _remove(self, entry: Tuple[str, int, str]):
+        position = bisect_left(self._entries, entry)
+        if position < len(self._entries) and self._entries[position] == entry:
+            del self._entries[position]
+
+    def add(self, tag_id: int, name: str):
+        entry = (name.lower(), tag_id, name)
+        self._add(entry)
+        if self._journal is not None:
+            self._journal.append((True, entry))
+
+    def remove(self, tag_id: int, name: str):
+        entry = (name.lower(), tag_id, name)
+        self._remove(entry)
+        if self._journal is not None:
+            self._journal.append((False, entry))
+
+    def rename(self, tag_id: int, old_name: str, new_name: str):
+        self.remove(tag_id, old_name)
+        self.add(tag_id, new_name)
+
+    def suggest(self, prefix: str, limit: int) -> List[dict]:
+        """
+        The suggest function returns the tags whose name starts with the prefix, ignoring case,
+        in alphabetical order.
+
+        :param prefix: str: The beginning of the tag name
+        :param limit: int: The maximal number of tags
+        :return: A list of dictionaries with id and name
+        """
+        prefix = prefix.lower()
+        suggestions = []
+        position = bisect_left(self._entries, (prefix,))
+        while position < len(self._entries) and len(suggestions) < limit:
+            lower, tag_id, name = self._entries[position]
+            if not lower.startswith(prefix):
+                break
+            suggestions.append({"id": tag_id, "name": name})
+            position += 1
+        return suggestions
+
+
+tag_index = TagIndex()
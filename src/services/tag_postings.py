@@ -0,0 +1,93 @@
+import heapq
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import image_m2m_tag
+from src.services.local_cache import ExpiringLRUCache
+
+
+def _contains(postings: array, image_id: int) -> bool:
+    position = bisect_left(postings, image_id)
+    return position < len(postings) and postings[position] == image_id
+
+
+def intersect(postings: List[array], after_id: int, limit: int) -> List[int]:
+    """
+    The intersect function returns the first image ids after after_id that are in every posting list.
+    It walks the shortest list and looks the ids up in the others with bisect.
+
+    :param postings: List[array]: Sorted image ids of every tag
+    :param after_id: int: The cursor, only bigger ids are returned
+    :param limit: int: The maximal number of ids
+    :return: A sorted list of image ids
+    """
+    shortest, *others = sorted(postings, key=len)
+    image_ids = []
+    for position in range(bisect_right(shortest, after_id), len(shortest)):
+        image_id = shortest[position]
+        if all(_contains(other, image_id) for other in others):
+            image_ids.append(image_id)
+            if len(image_ids) == limit:
+                break
+    return image_ids
+
+
+def union(postings: List[array], after_id: int, limit: int) -> List[int]:
+    """
+    The union function returns the first image ids after after_id that are in any posting list.
+
+    :param postings: List[array]: Sorted image ids of every tag
+    :param after_id: int: The cursor, only bigger ids are returned
+    :param limit: int: The maximal number of ids
+    :return: A sorted list of image ids
+    """
+    merged = heapq.merge(*[postings_list[bisect_right(postings_list, after_id):] for postings_list in postings])
+    image_ids = []
+    for image_id in merged:
+        if not image_ids or image_ids[-1] != image_id:
+            image_ids.append(image_id)
+            if len(image_ids) == limit:
+                break
+    return image_ids
+
+
+class PostingListCache:
+    """
+    The PostingListCache keeps the sorted image ids of the tags in memory for multi-tag searches.
+    Tags with more than max_length images are not cached, the search runs in the database for them.
+    Attaching and detaching tags invalidates the lists of this process, the other processes
+    pick the change up when their entries expire.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, max_length: int):
+        self.ttl = ttl
+        self.max_length = max_length
+        self._lists = ExpiringLRUCache(maxsize)
+
+    async def get(self, tag_id: int, db: AsyncSession) -> array | None:
+        postings = self._lists.get(tag_id)
+        if postings is not None:
+            return postings
+        result = await db.execute(select(image_m2m_tag.c.image_id)
+                                  .filter(image_m2m_tag.c.tag_id == tag_id)
+                                  .order_by(image_m2m_tag.c.image_id)
+                                  .limit(self.max_length + 1))
+        postings = array("q", result.scalars().all())
+        if len(postings) > self.max_length:
+            return None
+        self._lists.set(tag_id, postings, time.time() + self.ttl)
+        return postings
+
+    def invalidate(self, tag_ids: List[int]):
+        for tag_id in tag_ids:
+            self._lists.pop(tag_id)
+
+
+posting_lists = PostingListCache(settings.tag_postings_cache_size, settings.tag_postings_cache_ttl,
+                                 settings.tag_postings_max_length)
@@ -1,35 +1,147 @@
-# poetry add "qrcode[pil]"
-# poetry add cloudinary
-
+import asyncio
+import hashlib
 import io
+from collections import OrderedDict
+from pathlib import Path
+
 import qrcode
-from PIL import Image
-import cloudinary
-import cloudinary.uploader
+import qrcode.image.svg
 
 from src.conf.config import settings
 
-cloudinary.config(
-    cloud_name=settings.cloudinary_name,
-    api_key=settings.cloudinary_api_key,
-    api_secret=settings.cloudinary_api_secret,
-    secure=True
-)
+QRCODE_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def normalize_transformations(transformations: list[dict]) -> list[dict]:
+    """
+    The normalize_transformations function brings the transformation parameters to one form:
+    strings are lower case and angles are in 0..359. A parameter that normalizes to a no-op (a rotation
+    by a multiple of 360 degrees) is dropped, so it does not change the key of the transformation.
+
+    :param transformations: list[dict]: The transformation steps, e.g. [{'width': 500}, {'crop': 'Fill'}]
+    :return: The normalized steps in the same order
+    """
+    normalized = []
+    for step in transformations:
+        step = {name: value.strip().lower() if isinstance(value, str) else value for name, value in step.items()}
+        if "angle" in step:
+            step["angle"] = int(step["angle"]) % 360
+            if not step["angle"]:
+                del step["angle"]
+        if step:
+            normalized.append(step)
+    return normalized
+
+
+def transformation_key(transformations: list[dict]) -> str:
+    """
+    The transformation_key function builds the canonical key of a transformation: the normalized
+    parameters ordered by name, so the same transformation always gets the same key.
+
+    :param transformations: list[dict]: The transformation steps
+    :return: The canonical key, e.g. angle=15,crop=fill,width=500
+    """
+    params = {}
+    for step in normalize_transformations(transformations):
+        params.update(step)
+    return ",".join(f"{name}={params[name]}" for name in sorted(params))
 
 
 # Генеруємо QR-код "на лeту", без збереження на сервері:
-def create_qrcode(image_url):
+def create_qrcode(image_url: str, fmt: str = "png", box_size: int = 10, border: int = 4) -> bytes:
     # Creating the object QR-code
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
+    image_factory = qrcode.image.svg.SvgPathImage if fmt == "svg" else None
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border, image_factory=image_factory)
     qr.add_data(image_url)
     qr.make(fit=True)
 
     # Creating the QR-code in memory
-    img = qr.make_image(fill_color="black", back_color="white")
     image_stream = io.BytesIO()
-    img.save(image_stream, format="PNG")
-    image_stream.seek(0)
+    if fmt == "svg":
+        qr.make_image().save(image_stream)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(image_stream, format="PNG")
+    return image_stream.getvalue()
+
+
+class QRCodeCache:
+    """
+    The QRCodeCache keeps rendered QR codes in an LRU bounded by the total size of the renders,
+    with an optional directory on disk as the second tier. The key is a digest of the url and the
+    render options, so it is also used as the ETag of the response.
+    """
+
+    def __init__(self, max_bytes: int, directory: str | None = None):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self._size = 0
+        self._data = OrderedDict()
+
+    @staticmethod
+    def key(image_url: str, fmt: str, box_size: int, border: int) -> str:
+        return hashlib.sha256(f"{fmt}:{box_size}:{border}:{image_url}".encode()).hexdigest()
+
+    def _get_memory(self, key: str) -> bytes | None:
+        content = self._data.get(key)
+        if content is not None:
+            self._data.move_to_end(key)
+        return content
+
+    def _set_memory(self, key: str, content: bytes):
+        if len(content) > self.max_bytes:
+            return
+        if key in self._data:
+            self._size -= len(self._data.pop(key))
+        self._data[key] = content
+        self._size += len(content)
+        while self._size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._size -= len(evicted)
+
+    def pop(self, key: str):
+        """
+        The pop function drops a QR code from the memory tier, the next request renders it or reads it from disk.
+
+        :param key: str: The cache key
+        :return: Nothing
+        """
+        content = self._data.pop(key, None)
+        if content is not None:
+            self._size -= len(content)
+
+    def _read_disk(self, key: str) -> bytes | None:
+        path = self.directory / key
+        return path.read_bytes() if path.is_file() else None
+
+    def _write_disk(self, key: str, content: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f"{key}.tmp"
+        tmp.write_bytes(content)
+        tmp.replace(self.directory / key)
+
+    async def get_or_render(self, image_url: str, fmt: str = "png", box_size: int = 10,
+                            border: int = 4) -> tuple[str, bytes]:
+        """
+        The get_or_render function returns the QR code of an url from the cache and renders it on a miss.
+
+        :param image_url: str: The url encoded in the QR code
+        :param fmt: str: png or svg
+        :param box_size: int: The size of a QR code module in pixels
+        :param border: int: The width of the border in modules
+        :return: A tuple of the cache key and the rendered bytes
+        """
+        key = self.key(image_url, fmt, box_size, border)
+        content = self._get_memory(key)
+        if content is not None:
+            return key, content
+        if self.directory:
+            content = await asyncio.to_thread(self._read_disk, key)
+        if content is None:
+            content = await asyncio.to_thread(create_qrcode, image_url, fmt, box_size, border)
+            if self.directory:
+                await asyncio.to_thread(self._write_disk, key, content)
+        self._set_memory(key, content)
+        return key, content
+
 
-    # show image
-    qr_image = Image.open(image_stream)
-    return qr_image.show()
\ No newline at end of file
+qrcode_cache = QRCodeCache(settings.qrcode_cache_bytes, settings.qrcode_cache_dir)
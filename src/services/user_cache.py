@@ -0,0 +1,98 @@
+import json
+import logging
+import time
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import User, Role
+from src.services import metrics
+from src.services.local_cache import ExpiringLRUCache
+
+CACHED_FIELDS = ("id", "username", "email", "avatar", "role", "confirmed", "banned")
+
+
+def dump_user(user: User) -> str:
+    data = {field: getattr(user, field) for field in CACHED_FIELDS}
+    data["role"] = data["role"].value if isinstance(data["role"], Role) else data["role"]
+    return json.dumps(data, separators=(",", ":"))
+
+
+def load_user(raw: str | bytes) -> User:
+    data = json.loads(raw)
+    data["role"] = Role(data["role"]) if data["role"] else None
+    return User(**data)
+
+
+class UserCache:
+    """
+    The UserCache keeps the users resolved by get_current_user in two tiers: a small in-process
+    LRU with a short TTL in front of Redis. Only the fields listed in CACHED_FIELDS are stored,
+    the password hash and the refresh token never leave the database.
+    """
+
+    def __init__(self, client: redis.Redis, ttl: int, local_ttl: float, local_size: int):
+        self.client = client
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self._local = ExpiringLRUCache(local_size)
+
+    @staticmethod
+    def _key(email: str) -> str:
+        return f"user:{email}"
+
+    async def get(self, email: str) -> User | None:
+        """
+        The get function returns the cached user, looking at the local tier first and at Redis next.
+
+        :param email: str: The email of the user
+        :return: A detached user object or None on a miss
+        """
+        raw = self._local.get(email)
+        if raw is not None:
+            metrics.CACHE_REQUESTS.labels("user_local", "hit").inc()
+            return load_user(raw)
+        try:
+            with metrics.REDIS_DURATION.labels("user_cache", "get").time():
+                raw = await self.client.get(self._key(email))
+        except RedisError as err:
+            logging.warning("User cache is unavailable: %s", err)
+            return None
+        if raw is None:
+            metrics.CACHE_REQUESTS.labels("user", "miss").inc()
+            return None
+        metrics.CACHE_REQUESTS.labels("user", "hit").inc()
+        raw = raw.decode() if isinstance(raw, bytes) else raw
+        self._local.set(email, raw, time.time() + self.local_ttl)
+        return load_user(raw)
+
+    async def set(self, user: User):
+        raw = dump_user(user)
+        self._local.set(user.email, raw, time.time() + self.local_ttl)
+        try:
+            with metrics.REDIS_DURATION.labels("user_cache", "setex").time():
+                await self.client.setex(self._key(user.email), self.ttl, raw)
+        except RedisError as err:
+            logging.warning("User cache is unavailable: %s", err)
+
+    async def invalidate(self, email: str):
+        """
+        The invalidate function drops the user from both tiers. It has to be called after every write
+        that changes a cached field (confirmed, banned, role) or the password.
+
+        :param email: str: The email of the user
+        :return: Nothing
+        """
+        self._local.pop(email)
+        try:
+            with metrics.REDIS_DURATION.labels("user_cache", "delete").time():
+                await self.client.delete(self._key(email))
+        except RedisError as err:
+            logging.warning("User cache is unavailable: %s", err)
+
+
+user_cache = UserCache(redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0),
+                       ttl=settings.user_cache_ttl,
+                       local_ttl=settings.user_cache_local_ttl,
+                       local_size=settings.user_cache_local_size)
@@ -0,0 +1,90 @@
+"""
+The tests run the app in process against a temporary SQLite database (or TEST_DATABASE_URL, whose tables
+are DROPPED), fakeredis and the local storage backend. The environment is set before the app is imported.
+"""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix="photoshare-tests-")
+os.environ.update({
+    "SQLALCHEMY_DATABASE_URL": os.environ.get("TEST_DATABASE_URL",
+                                              f"sqlite+aiosqlite:///{os.path.join(WORKDIR, 'test.sqlite3')}"),
+    "STORAGE_BACKEND": "local",
+    "STORAGE_LOCAL_PATH": os.path.join(WORKDIR, "media"),
+    "BCRYPT_ROUNDS": "4",
+    # the guard against N+1 listings: every GET request fails with 500 when it runs more statements than this
+    "DB_QUERY_BUDGET": "10",
+    # the tests read the number of statements of a request from the Server-Timing header
+    "DB_SERVER_TIMING": "true",
+})
+
+import fakeredis  # noqa: E402
+import redis.asyncio  # noqa: E402
+
+_server = fakeredis.FakeServer()
+
+
+class FakeRedis(fakeredis.aioredis.FakeRedis):
+    # every client of the app shares one fake server, like they share one Redis
+    def __init__(self, *args, **kwargs):
+        kwargs["server"] = _server
+        super().__init__(*args, **kwargs)
+
+
+redis.asyncio.Redis = FakeRedis
+
+import httpx  # noqa: E402
+
+PASSWORD = "secret1"
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client():
+    import main
+    from src.database.db import engine
+    from src.database.models import Base
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    await main.app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as http:
+            yield http
+    finally:
+        await main.app.router.shutdown()
+        await engine.dispose()
+
+
+async def create_user(client: httpx.AsyncClient) -> dict:
+    """
+    The create_user function signs up, confirms and logs in a new user. The first user of the session is the admin.
+
+    :param client: httpx.AsyncClient: The client of the app
+    :return: The id of the user and the headers of its requests
+    """
+    from src.services.auth import auth_service
+
+    name = uuid.uuid4().hex[:12]
+    email = f"{name}@example.com"
+    response = await client.post("/api/auth/signup", json={"username": name, "email": email, "password": PASSWORD})
+    assert response.status_code == 201, response.text
+    user_id = response.json()["id"]
+    token = auth_service.create_email_token({"sub": email})
+    assert (await client.get(f"/api/auth/confirmed_email/{token}")).status_code == 200
+    response = await client.post("/api/auth/login", data={"username": email, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return {"id": user_id, "headers": {"Authorization": f"Bearer {response.json()['access_token']}"}}
+
+
+@pytest.fixture
+async def user(client):
+    return await create_user(client)
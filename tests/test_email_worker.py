@@ -0,0 +1,148 @@
+import asyncio
+import json
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+
+
+class Handler:
+    """
+    The Handler of the test SMTP server keeps the delivered messages and rejects the next `failures` ones.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.failures = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failures:
+            self.failures -= 1
+            return "451 Requested action aborted: try again later"
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    from src.conf.config import settings
+
+    handler = Handler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    for name, value in (("mail_server", "127.0.0.1"), ("mail_port", controller.port), ("mail_ssl_tls", False),
+                        ("mail_starttls", False), ("mail_use_credentials", False)):
+        monkeypatch.setattr(settings, name, value)
+    try:
+        yield handler
+    finally:
+        controller.stop()
+
+
+@pytest.fixture
+async def worker(client, smtp_server):
+    # the client keeps the event loop of the session, the Redis connections of the app are bound to it
+    from src.services.email import MailQueue, mail_queue
+    from src.services.email_worker import MailWorker
+
+    await mail_queue.client.delete(MailQueue.OUTBOX, MailQueue.RETRY, MailQueue.DEAD)
+    worker = MailWorker(mail_queue, batch_size=10, max_attempts=2, retry_delay=0, idle_timeout=30, ttl=60,
+                        redis_retry=1)
+    await mail_queue.register(worker.worker_id, worker.ttl)
+    try:
+        yield worker
+    finally:
+        await worker.close()
+        await mail_queue.unregister(worker.worker_id)
+
+
+def job(template: str = "email_template.html") -> dict:
+    return {"subject": "Confirm your email", "recipient": "reader@example.com", "template": template,
+            "body": {"host": "http://test/", "username": "reader", "token": "token"}, "attempts": 0}
+
+
+async def dead_jobs(worker) -> list:
+    return [json.loads(raw) for raw in await worker.queue.client.lrange(worker.queue.DEAD, 0, -1)]
+
+
+@pytest.mark.anyio
+async def test_worker_sends_queued_emails(worker, smtp_server):
+    for _ in range(3):
+        await worker.queue.enqueue(job())
+
+    assert await worker.run_once() == 3
+
+    assert len(smtp_server.messages) == 3
+    assert smtp_server.messages[0].rcpt_tos == ["reader@example.com"]
+    assert await worker.queue.client.llen(worker.queue.PROCESSING + worker.worker_id) == 0
+
+
+@pytest.mark.anyio
+async def test_worker_retries_rejected_emails(worker, smtp_server):
+    smtp_server.failures = 1
+    await worker.queue.enqueue(job())
+
+    await worker.run_once()
+    assert smtp_server.messages == []
+    assert await worker.queue.client.zcard(worker.queue.RETRY) == 1
+
+    # the retry delay is 0, the job is due at once
+    await worker.run_once()
+    assert len(smtp_server.messages) == 1
+    assert await worker.queue.client.zcard(worker.queue.RETRY) == 0
+    assert await dead_jobs(worker) == []
+
+
+@pytest.mark.anyio
+async def test_worker_buries_emails_after_max_attempts(worker, smtp_server):
+    smtp_server.failures = worker.max_attempts
+    await worker.queue.enqueue(job())
+
+    for _ in range(worker.max_attempts):
+        await worker.run_once()
+
+    assert smtp_server.messages == []
+    assert [dead["attempts"] for dead in await dead_jobs(worker)] == [worker.max_attempts]
+    assert await worker.queue.client.zcard(worker.queue.RETRY) == 0
+
+
+@pytest.mark.anyio
+async def test_worker_buries_broken_jobs_without_retrying(worker, smtp_server):
+    await worker.queue.enqueue(job(template="missing.html"))
+    await worker.queue.client.lpush(worker.queue.OUTBOX, "not json")
+    await worker.queue.enqueue(job())
+
+    assert await worker.run_once() == 3
+
+    # the broken jobs do not stop the batch
+    assert len(smtp_server.messages) == 1
+    assert await worker.queue.client.zcard(worker.queue.RETRY) == 0
+    dead = await worker.queue.client.lrange(worker.queue.DEAD, 0, -1)
+    assert sorted(dead, key=len) == [b"not json", json.dumps(job(template="missing.html")).encode()]
+    assert await worker.queue.client.llen(worker.queue.PROCESSING + worker.worker_id) == 0
+
+
+@pytest.mark.anyio
+async def test_worker_waits_for_redis_instead_of_exiting(worker, monkeypatch):
+    from redis.exceptions import RedisError
+
+    calls = 0
+
+    async def run_once(timeout: float = 1.0) -> int:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RedisError("Connection refused")
+        # stops the worker like a shutdown does
+        raise asyncio.CancelledError
+
+    monkeypatch.setattr(worker, "run_once", run_once)
+    with pytest.raises(asyncio.CancelledError):
+        await worker.run()
+    assert calls == 2
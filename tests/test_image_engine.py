@@ -0,0 +1,42 @@
+import io
+import uuid
+
+import pytest
+from PIL import Image
+
+from src.services.image_engine import image_engine
+from src.services.storage import storage
+
+
+def jpeg(color) -> bytes:
+    stream = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(stream, format="JPEG")
+    return stream.getvalue()
+
+
+def store(content: bytes) -> str:
+    key = f"tests/{uuid.uuid4().hex}.jpg"
+    path = storage.path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return key
+
+
+@pytest.mark.anyio
+async def test_derivatives_are_addressed_by_content():
+    first, copy, other = store(jpeg((200, 0, 0))), store(jpeg((200, 0, 0))), store(jpeg((0, 0, 200)))
+    paths = [await image_engine.derivative_path(storage.path(key), "width=32") for key in (first, copy, other)]
+    assert paths[0] == paths[1] != paths[2]
+    assert paths[0] != await image_engine.derivative_path(storage.path(first), "width=16")
+
+
+@pytest.mark.anyio
+async def test_transforming_a_file_that_is_no_image_is_rejected(client):
+    key = store(b"\xff\xd8\xff but not a jpeg")
+    response = await client.get(f"/api/images/files/{key}", params={"transformation": "width=32"})
+    assert response.status_code == 422, response.text
+
+    key = store(jpeg((0, 200, 0)))
+    response = await client.get(f"/api/images/files/{key}", params={"transformation": "width=32"})
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.content)).size == (32, 24)
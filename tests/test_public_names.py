@@ -0,0 +1,36 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image as PILImage
+from sqlalchemy import select
+
+from src.database.db import SessionLocal
+from src.database.models import Image, PublicNameCounter
+
+UPLOADS = 20
+
+
+def jpeg() -> bytes:
+    stream = io.BytesIO()
+    PILImage.new("RGB", (8, 8), (200, 120, 40)).save(stream, format="JPEG")
+    return stream.getvalue()
+
+
+@pytest.mark.anyio
+async def test_concurrent_uploads_of_one_filename_get_distinct_names(client, user):
+    content = jpeg()
+
+    async def upload():
+        return await client.post("/api/images/add", params={"description": "stress"}, headers=user["headers"],
+                                 files={"file": ("IMG_0001.jpg", content, "image/jpeg")})
+
+    responses = await asyncio.gather(*[upload() for _ in range(UPLOADS)])
+
+    assert [response.status_code for response in responses] == [201] * UPLOADS
+    image_ids = [response.json()["image"]["id"] for response in responses]
+    async with SessionLocal() as db:
+        names = (await db.execute(select(Image.public_name).filter(Image.id.in_(image_ids)))).scalars().all()
+        counter = await db.get(PublicNameCounter, "IMG_0001")
+    assert len(set(names)) == UPLOADS
+    assert counter.counter == UPLOADS
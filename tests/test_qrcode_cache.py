@@ -0,0 +1,53 @@
+import pytest
+
+from src.services import transformed_image
+from src.services.transformed_image import QRCodeCache
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """
+    The renders fixture replaces the QR code renderer with one of 100 bytes per url and records its calls.
+    """
+    calls = []
+
+    def create_qrcode(image_url: str, fmt: str, box_size: int, border: int) -> bytes:
+        calls.append(image_url)
+        return image_url.encode().ljust(100, b".")
+
+    monkeypatch.setattr(transformed_image, "create_qrcode", create_qrcode)
+    return calls
+
+
+@pytest.mark.anyio
+async def test_memory_is_bounded_by_bytes(renders):
+    cache = QRCodeCache(max_bytes=250)
+    for url in ("a", "b", "c"):
+        await cache.get_or_render(url)
+
+    # the third render does not fit, the least recently used one is evicted
+    assert cache._size == 200
+    assert list(cache._data) == [cache.key(url, "png", 10, 4) for url in ("b", "c")]
+    await cache.get_or_render("b")
+    await cache.get_or_render("a")
+    assert renders == ["a", "b", "c", "a"]
+    assert list(cache._data) == [cache.key(url, "png", 10, 4) for url in ("b", "a")]
+
+
+@pytest.mark.anyio
+async def test_renders_larger_than_the_cache_are_not_kept(renders):
+    cache = QRCodeCache(max_bytes=50)
+    key, content = await cache.get_or_render("a")
+    assert len(content) == 100
+    assert cache._size == 0 and not cache._data
+
+
+@pytest.mark.anyio
+async def test_evicted_codes_are_read_from_disk(renders, tmp_path):
+    cache = QRCodeCache(max_bytes=100, directory=str(tmp_path))
+    first = await cache.get_or_render("a")
+    await cache.get_or_render("b")
+
+    assert await cache.get_or_render("a") == first
+    assert renders == ["a", "b"]
+    assert cache._size == 100
@@ -0,0 +1,91 @@
+import re
+import uuid
+
+import pytest
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.database.models import Comment, Image, Rating, User
+from src.repository.ratings import update_rating_stats
+
+ROWS = 50
+
+
+def query_count(response) -> int:
+    return int(re.search(r'desc="(\d+) queries"', response.headers["server-timing"]).group(1))
+
+
+@pytest.fixture
+async def listed_rows():
+    """
+    The listed_rows fixture stores an image with ROWS comments and ROWS ratings, and ROWS rated images,
+    every one by another user, so a listing that loads the user of every row runs a query per row.
+    """
+    prefix = uuid.uuid4().hex[:8]
+    async with SessionLocal() as db:
+        users = [User(username=f"{prefix}{number}", email=f"{prefix}{number}@example.com", password="-",
+                      confirmed=True)
+                 for number in range(ROWS + 1)]
+        db.add_all(users)
+        await db.flush()
+        images = [Image(url=f"https://example.com/{prefix}{number}.jpg", description="listed",
+                        public_name=f"{prefix}{number}", user_id=users[number].id)
+                  for number in range(ROWS)]
+        db.add_all(images)
+        await db.flush()
+        db.add_all([Comment(comment="listed", user_id=user.id, image_id=images[0].id) for user in users[:ROWS]])
+        # the first image is rated by every other user, every other image by one user
+        raters = [(image, users[(number + 1) % ROWS]) for number, image in enumerate(images[1:], 1)]
+        raters += [(images[0], user) for user in users[1:]]
+        for number, (image, rater) in enumerate(raters):
+            db.add(Rating(rating=number % 5 + 1, user_id=rater.id, image_id=image.id))
+            await update_rating_stats(image.id, db, added=number % 5 + 1)
+        await db.commit()
+        return [image.id for image in images]
+
+
+@pytest.mark.anyio
+async def test_query_budget_is_enabled():
+    assert settings.db_query_budget
+
+
+@pytest.mark.anyio
+async def test_comment_pages_stay_within_the_budget(client, user, listed_rows):
+    # the first request of a user also loads the user into the user cache
+    await client.get("/api/comments/", headers=user["headers"], params={"image_id": listed_rows[0], "limit": 1})
+    counts = []
+    for limit in (5, 50):
+        response = await client.get("/api/comments/", headers=user["headers"],
+                                    params={"image_id": listed_rows[0], "limit": limit})
+        assert response.status_code == 200, response.text
+        assert len(response.json()) == limit
+        counts.append(query_count(response))
+    assert counts[0] == counts[1] <= settings.db_query_budget
+
+
+@pytest.mark.anyio
+async def test_rating_pages_stay_within_the_budget(client, user, listed_rows):
+    await client.get("/api/ratings/images/average", headers=user["headers"], params={"image_ids": listed_rows[:1]})
+    counts = []
+    for size in (5, 50):
+        response = await client.get("/api/ratings/images/average", headers=user["headers"],
+                                    params={"image_ids": listed_rows[:size]})
+        assert response.status_code == 200, response.text
+        assert len(response.json()) == size
+        counts.append(query_count(response))
+    assert counts[0] == counts[1] <= settings.db_query_budget
+
+
+@pytest.mark.anyio
+async def test_rating_listings_stay_within_the_budget(client, user, listed_rows):
+    url = f"/api/ratings/image/{listed_rows[0]}/list"
+    await client.get(url, headers=user["headers"], params={"limit": 1})
+    counts = []
+    for limit in (5, 50):
+        response = await client.get(url, headers=user["headers"], params={"limit": limit})
+        assert response.status_code == 200, response.text
+        ratings = response.json()
+        assert len(ratings) == limit
+        assert len({rating["user"]["id"] for rating in ratings}) == limit
+        counts.append(query_count(response))
+    assert counts[0] == counts[1] <= settings.db_query_budget
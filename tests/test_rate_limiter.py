@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def make_limiter(server):
+    from src.services.rate_limiter import RateLimiter
+
+    def make_limiter():
+        # every limiter stands for an app process with a client of its own
+        return RateLimiter(fakeredis.aioredis.FakeRedis(server=server), limits={}, sync_interval=0,
+                           redis_retry=60, local_size=100)
+
+    return make_limiter
+
+
+async def synced(limiter):
+    await asyncio.gather(*limiter._tasks)
+
+
+@pytest.mark.anyio
+async def test_the_sliding_window_is_shared_between_processes(make_limiter):
+    first, second = make_limiter(), make_limiter()
+    for _ in range(3):
+        assert first.check("key", 3, 60) == 0
+        await synced(first)
+
+    # the second process allows one request before its sync learns that the window is full
+    assert second.check("key", 3, 60) == 0
+    await synced(second)
+    retry_after = second.check("key", 3, 60)
+    assert 59 < retry_after <= 60
+    assert first.check("other", 3, 60) == 0
+
+
+@pytest.mark.anyio
+async def test_limits_locally_while_redis_is_down(make_limiter, server):
+    limiter = make_limiter()
+    server.connected = False
+    assert limiter.check("key", 2, 60) == 0
+    await synced(limiter)
+    assert limiter._redis_down_until > time.monotonic()
+
+    assert limiter.check("key", 2, 60) == 0
+    # no sync is started before redis_retry
+    assert not limiter._tasks
+    assert 29 < limiter.check("key", 2, 60) <= 30
+
+
+@pytest.mark.anyio
+async def test_close_closes_the_client(make_limiter):
+    limiter = make_limiter()
+    closed = False
+
+    async def close():
+        nonlocal closed
+        closed = True
+
+    limiter.client.close = close
+    limiter.check("key", 3, 60)
+    await limiter.close()
+    assert not limiter._tasks
+    assert closed
+
+
+@pytest.mark.anyio
+async def test_rejected_requests_get_retry_after(client, user, monkeypatch):
+    from src.services.rate_limiter import rate_limiter
+
+    monkeypatch.setitem(rate_limiter.limits, "comments:list", {"default": (2, 60)})
+    for _ in range(2):
+        response = await client.get("/api/comments/", headers=user["headers"])
+        assert response.status_code == 200, response.text
+
+    response = await client.get("/api/comments/", headers=user["headers"])
+    assert response.status_code == 429
+    assert response.json()["detail"] == "Too Many Requests"
+    assert 30 <= int(response.headers["Retry-After"]) <= 60
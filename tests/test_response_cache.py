@@ -0,0 +1,94 @@
+from typing import List
+
+import fakeredis
+import pytest
+from starlette.requests import Request
+
+
+def request(path: str = "/api/tags/") -> Request:
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []})
+
+
+class Loader:
+    """
+    The Loader stands in for the database, it counts the loads and returns the current rows.
+    """
+
+    def __init__(self):
+        self.loads = 0
+        self.rows = [1]
+
+    async def __call__(self) -> List[int]:
+        self.loads += 1
+        return list(self.rows)
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def cache(server):
+    from src.services.response_cache import ResponseCache
+
+    # a client of its own, conftest shares one server between all clients of the app
+    return ResponseCache(fakeredis.aioredis.FakeRedis(server=server), ttl=60, local_size=100, redis_retry=0)
+
+
+@pytest.mark.anyio
+async def test_invalidation_during_an_outage_is_applied_when_redis_is_back(cache, server):
+    load = Loader()
+    await cache.respond(request(), ["tags"], List[int], load)
+    await cache.respond(request(), ["tags"], List[int], load)
+    assert load.loads == 1
+
+    server.connected = False
+    load.rows = [1, 2]
+    await cache.invalidate("tags")
+    response = await cache.respond(request(), ["tags"], List[int], load)
+    assert response.body == b"[1,2]"
+
+    server.connected = True
+    # the entry stored in Redis before the outage is not served
+    response = await cache.respond(request(), ["tags"], List[int], load)
+    assert response.body == b"[1,2]"
+    assert load.loads == 3
+    await cache.respond(request(), ["tags"], List[int], load)
+    assert load.loads == 3
+
+
+@pytest.mark.anyio
+async def test_namespaces_with_failed_invalidations_are_not_cached(cache, server):
+    load = Loader()
+    server.connected = False
+    await cache.invalidate("tags")
+
+    for _ in range(3):
+        await cache.respond(request(), ["tags"], List[int], load)
+        await cache.respond(request("/api/comments/"), ["comments"], List[int], load)
+    # only the comments are cached, in process memory
+    assert load.loads == 4
+
+
+@pytest.mark.anyio
+async def test_redis_is_not_retried_before_redis_retry(cache, server, monkeypatch):
+    cache.redis_retry = 60
+    server.connected = False
+    load = Loader()
+    await cache.respond(request(), ["tags"], List[int], load)
+
+    calls = 0
+    mget = cache.client.mget
+
+    async def counted_mget(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return await mget(*args, **kwargs)
+
+    monkeypatch.setattr(cache.client, "mget", counted_mget)
+    server.connected = True
+    await cache.respond(request(), ["tags"], List[int], load)
+    await cache.invalidate("tags")
+    assert calls == 0
+    assert await cache.client.get(cache.VERSION_PREFIX + "tags") is None
@@ -0,0 +1,59 @@
+import uuid
+
+import pytest
+
+from src.database.db import SessionLocal
+from src.database.models import Comment, Image
+
+
+@pytest.fixture
+async def documents(user):
+    """
+    The documents fixture stores images and comments whose texts contain a new term: the denser the term
+    in a text, the better it matches. The last image is an unfinished upload (without url).
+    """
+    term = f"t{uuid.uuid4().hex[:10]}"
+    texts = [f"{term} in a long description of a sunset over the sea with some boats",
+             f"{term} {term} {term} at dusk",
+             f"a {term} and a lighthouse"]
+    async with SessionLocal() as db:
+        images = [Image(url=f"https://example.com/{term}{number}.jpg", description=text,
+                        public_name=f"{term}{number}", user_id=user["id"]) for number, text in enumerate(texts)]
+        unfinished = Image(url=None, description=f"{term} {term} {term} {term}", public_name=f"{term}x",
+                           user_id=user["id"])
+        db.add_all(images + [unfinished])
+        await db.flush()
+        comments = [Comment(comment=text, user_id=user["id"], image_id=images[0].id) for text in texts]
+        db.add_all(comments)
+        await db.commit()
+        return term, [image.id for image in images], [comment.id for comment in comments]
+
+
+@pytest.mark.anyio
+async def test_images_are_ranked_by_relevance(client, user, documents):
+    term, image_ids, _ = documents
+    response = await client.get("/api/search/images", headers=user["headers"], params={"q": term})
+    assert response.status_code == 200, response.text
+    # the unfinished upload matches best but has no url
+    assert [image["id"] for image in response.json()] == [image_ids[1], image_ids[2], image_ids[0]]
+
+
+@pytest.mark.anyio
+async def test_every_term_has_to_match(client, user, documents):
+    term, image_ids, comment_ids = documents
+    params = {"q": f"{term.upper()} lighthouse!"}
+    response = await client.get("/api/search/images", headers=user["headers"], params=params)
+    assert [image["id"] for image in response.json()] == [image_ids[2]]
+    response = await client.get("/api/search/comments", headers=user["headers"], params=params)
+    assert [comment["id"] for comment in response.json()] == [comment_ids[2]]
+
+
+@pytest.mark.anyio
+async def test_comments_are_ranked_by_relevance(client, user, documents):
+    term, _, comment_ids = documents
+    response = await client.get("/api/search/comments", headers=user["headers"], params={"q": term, "limit": 2})
+    assert response.status_code == 200, response.text
+    assert [comment["id"] for comment in response.json()] == [comment_ids[1], comment_ids[2]]
+    response = await client.get("/api/search/comments", headers=user["headers"],
+                                params={"q": term, "limit": 2, "offset": 2})
+    assert [comment["id"] for comment in response.json()] == [comment_ids[0]]
@@ -0,0 +1,42 @@
+from src.services.tag_index import TagIndex
+
+
+def names(index: TagIndex) -> list:
+    return [name for _, _, name in index._entries]
+
+
+def test_writes_during_a_rebuild_survive_the_swap():
+    index = TagIndex()
+    index.rebuild([(1, "alpha"), (2, "beta")])
+
+    index.start_rebuild()
+    # the snapshot was read before these writes
+    snapshot = [(1, "alpha"), (2, "beta")]
+    index.add(3, "gamma")
+    index.remove(2, "beta")
+    index.rebuild(snapshot)
+
+    assert names(index) == ["alpha", "gamma"]
+
+
+def test_replayed_writes_are_idempotent():
+    index = TagIndex()
+    index.start_rebuild()
+    index.add(3, "gamma")
+    index.remove(1, "alpha")
+    # the snapshot was read after the writes
+    index.rebuild([(3, "gamma")])
+    assert names(index) == ["gamma"]
+
+    # no rebuild is in progress, nothing is replayed on the next one
+    index.add(4, "delta")
+    index.rebuild([(3, "gamma")])
+    assert names(index) == ["gamma"]
+
+
+def test_aborted_rebuild_stops_recording():
+    index = TagIndex()
+    index.start_rebuild()
+    index.abort_rebuild()
+    index.add(1, "alpha")
+    assert index._journal is None
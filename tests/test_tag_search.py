@@ -0,0 +1,60 @@
+import uuid
+
+import pytest
+from sqlalchemy import insert
+
+from src.database.db import SessionLocal
+from src.database.models import Image, Tag, User, image_m2m_tag
+from src.services.tag_postings import posting_lists
+
+
+@pytest.fixture
+async def tagged_images(user):
+    """
+    The tagged_images fixture stores three images with two new tags: a finished upload with both tags,
+    a finished upload with the first tag and an unfinished upload (without url) with both tags.
+    """
+    prefix = uuid.uuid4().hex[:8]
+    async with SessionLocal() as db:
+        tags = [Tag(name=f"{prefix}a"), Tag(name=f"{prefix}b")]
+        images = [Image(url=f"https://example.com/{prefix}{number}.jpg" if number < 2 else None,
+                        description="tagged", public_name=f"{prefix}{number}", user_id=user["id"])
+                  for number in range(3)]
+        db.add_all(tags + images)
+        await db.flush()
+        await db.execute(insert(image_m2m_tag), [
+            {"image_id": images[0].id, "tag_id": tags[0].id}, {"image_id": images[0].id, "tag_id": tags[1].id},
+            {"image_id": images[1].id, "tag_id": tags[0].id},
+            {"image_id": images[2].id, "tag_id": tags[0].id}, {"image_id": images[2].id, "tag_id": tags[1].id},
+        ])
+        await db.commit()
+        return [tag.name for tag in tags], [image.id for image in images]
+
+
+@pytest.fixture(params=["postings", "database"])
+def search_path(request, monkeypatch):
+    if request.param == "database":
+        # no posting list is short enough to be cached, the search runs in the database
+        monkeypatch.setattr(posting_lists, "max_length", 0)
+    return request.param
+
+
+@pytest.mark.anyio
+async def test_tag_search_skips_unfinished_uploads(client, user, tagged_images, search_path):
+    tags, image_ids = tagged_images
+    for mode, expected in (("all", image_ids[:1]), ("any", image_ids[:2])):
+        response = await client.get("/api/images/search", headers=user["headers"],
+                                    params={"tags": tags, "mode": mode})
+        assert response.status_code == 200, response.text
+        assert [image["id"] for image in response.json()] == expected
+
+
+@pytest.mark.anyio
+async def test_tag_search_pages_skip_unfinished_uploads(client, user, tagged_images, search_path):
+    tags, image_ids = tagged_images
+    response = await client.get("/api/images/search", headers=user["headers"],
+                                params={"tags": tags[:1], "limit": 1, "after_id": image_ids[0]})
+    assert [image["id"] for image in response.json()] == [image_ids[1]]
+    response = await client.get("/api/images/search", headers=user["headers"],
+                                params={"tags": tags[:1], "limit": 1, "after_id": image_ids[1]})
+    assert response.json() == []
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from jose import JWTError
+
+from src.services import auth
+from src.services.auth import auth_service
+from src.services.local_cache import ExpiringLRUCache
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """
+    The decodes fixture gives the auth service an empty token cache of two entries
+    and counts the signature checks.
+    """
+    monkeypatch.setattr(auth_service, "token_cache", ExpiringLRUCache(2))
+    calls = []
+    decode = auth.jwt.decode
+
+    def counted_decode(token, *args, **kwargs):
+        calls.append(token)
+        return decode(token, *args, **kwargs)
+
+    monkeypatch.setattr(auth.jwt, "decode", counted_decode)
+    return calls
+
+
+@pytest.mark.anyio
+async def test_verified_tokens_are_decoded_once(decodes):
+    token = await auth_service.create_access_token({"sub": "reader@example.com"})
+
+    for _ in range(3):
+        assert auth_service.decode_access_token(token)["sub"] == "reader@example.com"
+    assert len(decodes) == 1
+
+
+@pytest.mark.anyio
+async def test_cached_claims_expire_with_the_token(decodes, monkeypatch):
+    token = await auth_service.create_access_token({"sub": "reader@example.com"}, expires_delta=60)
+    exp = auth_service.decode_access_token(token)["exp"]
+
+    monkeypatch.setattr(time, "time", lambda: exp + 1)
+    # the expired entry is dropped, the token is checked again
+    auth_service.decode_access_token(token)
+    assert len(decodes) == 2
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_tokens_are_evicted(decodes):
+    tokens = [await auth_service.create_access_token({"sub": f"reader{number}@example.com"}) for number in range(3)]
+
+    for token in tokens:
+        auth_service.decode_access_token(token)
+    auth_service.decode_access_token(tokens[2])
+    assert len(decodes) == 3
+    # the cache holds two tokens, the first one was evicted
+    auth_service.decode_access_token(tokens[0])
+    assert decodes[3:] == [tokens[0]]
+
+
+def test_invalid_tokens_are_not_cached(decodes):
+    for _ in range(2):
+        with pytest.raises(JWTError):
+            auth_service.decode_access_token("not.a.token")
+    assert len(decodes) == 2
+    assert len(auth_service.token_cache) == 0
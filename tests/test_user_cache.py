@@ -0,0 +1,75 @@
+import re
+import time
+
+import fakeredis
+import pytest
+
+from src.database.models import User, Role
+
+
+def queries(response) -> int:
+    return int(re.search(r'desc="(\d+) queries"', response.headers["Server-Timing"]).group(1))
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def cache(server):
+    from src.services.user_cache import UserCache
+
+    return UserCache(fakeredis.aioredis.FakeRedis(server=server), ttl=300, local_ttl=5, local_size=100)
+
+
+def reader() -> User:
+    return User(id=1, username="reader", email="reader@example.com", avatar=None, role=Role.user,
+                confirmed=True, banned=False, password="hash", refresh_token="token")
+
+
+@pytest.mark.anyio
+async def test_current_user_is_loaded_again_after_a_write(client, user):
+    from src.database.db import SessionLocal
+    from src.repository.users import confirmed_email
+    from src.services.auth import auth_service
+
+    # the tag suggestions come from memory, the only statement of the request loads the current user
+    params = {"q": "a"}
+    response = await client.get("/api/tags/suggest", headers=user["headers"], params=params)
+    assert response.status_code == 200, response.text
+    response = await client.get("/api/tags/suggest", headers=user["headers"], params=params)
+    assert queries(response) == 0
+
+    email = auth_service.decode_access_token(user["headers"]["Authorization"].split()[1])["sub"]
+    async with SessionLocal() as db:
+        await confirmed_email(email, db)
+    response = await client.get("/api/tags/suggest", headers=user["headers"], params=params)
+    assert queries(response) == 1
+
+
+@pytest.mark.anyio
+async def test_local_tier_expires_before_redis(cache, server, monkeypatch):
+    await cache.set(reader())
+    assert 0 < await cache.client.ttl(cache._key("reader@example.com")) <= 300
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    # the local entry is gone, the user comes from Redis and no secret was cached
+    server.connected = False
+    assert await cache.get("reader@example.com") is None
+    server.connected = True
+    user = await cache.get("reader@example.com")
+    assert (user.id, user.role, user.password, user.refresh_token) == (1, Role.user, None, None)
+    # and is back in the local tier
+    server.connected = False
+    assert (await cache.get("reader@example.com")).username == "reader"
+
+
+@pytest.mark.anyio
+async def test_invalidate_drops_both_tiers(cache):
+    await cache.set(reader())
+    await cache.invalidate("reader@example.com")
+
+    assert await cache.get("reader@example.com") is None
+    assert await cache.client.get(cache._key("reader@example.com")) is None